@@ -2,23 +2,103 @@
 
 import typing
 from abc import ABC, abstractmethod
+from array import array
 
 STARTING_FLOOR: int = 0
 MAX_FLOOR: int = 30
 TARGET_FLOOR: int = MAX_FLOOR
 
+
+# Elevator state is the floor plus a configurable tuple of small counters
+# (used by stateful rules, see ElevatorRule). Each field has a size, values
+# are 0 .. size-1. The whole state is packed into a single int (mixed radix,
+# floor in the lowest position), so the packed states are exactly
+# 0 .. state_count-1 and the search can use flat arrays indexed by state.
+
+class StateLayout:
+    def __init__(
+        self,
+        counters: typing.Sequence[tuple[str, int]] = (),
+        max_floor: int = MAX_FLOOR
+    ) -> None:
+        self.max_floor = max_floor
+        self.fields: tuple[tuple[str, int], ...] = (
+            (('floor', max_floor + 1),) + tuple(counters)
+        )
+
+        self.index: dict[str, int] = {}
+        self.radix: list[int] = []
+        state_count = 1
+
+        for i, (name, size) in enumerate(self.fields):
+            if name in self.index:
+                raise ValueError(f'Duplicate state field: {name}')
+
+            self.index[name] = i
+            self.radix.append(state_count)
+            state_count *= size
+
+        self.state_count: int = state_count
+
+    def pack(self, values: typing.Sequence[int]) -> int:
+        packed = 0
+
+        for value, radix in zip(values, self.radix):
+            packed += value * radix
+
+        return packed
+
+    def unpack(self, packed: int) -> list[int]:
+        values = []
+
+        for name, size in self.fields:
+            packed, value = divmod(packed, size)
+            values.append(value)
+
+        return values
+
+
+default_layout = StateLayout()
+
+
 class Elevator:
-    def __init__(self, floor: int = 0) -> None:
+    def __init__(
+        self,
+        floor: int = 0,
+        layout: StateLayout = default_layout,
+        counters: typing.Optional[typing.Sequence[int]] = None
+    ) -> None:
+        self.layout = layout
         self.set_floor(floor)
 
+        if counters is None:
+            counters = [0] * (len(layout.fields) - 1)
+
+        self.counters = list(counters)
+
     def set_floor(self, floor: int) -> None:
         self.floor = floor
 
     def get_floor(self) -> int:
         return self.floor
 
+    def get_counter(self, name: str) -> int:
+        return self.counters[self.layout.index[name] - 1]
+
+    def set_counter(self, name: str, value: int) -> None:
+        self.counters[self.layout.index[name] - 1] = value
+
+    def pack(self) -> int:
+        return self.layout.pack([self.floor] + self.counters)
+
+    @classmethod
+    def from_packed(cls, layout: StateLayout, packed: int) -> typing.Self:
+        floor, *counters = layout.unpack(packed)
+        elevator = cls(floor, layout, counters)
+        return elevator
+
     def clone(self) -> typing.Self:
-        elevator = Elevator( self.get_floor() )
+        elevator = Elevator( self.get_floor(), self.layout, self.counters )
         return elevator
 
 class Action(ABC):
@@ -28,6 +108,28 @@ class Action(ABC):
         71, 73, 79, 83, 89, 97
     }
 
+    # primes for larger buildings, sieved on demand (prime_flags[n] is 1 if n
+    # is prime, for n < len(prime_flags))
+    prime_flags: bytearray = bytearray()
+
+    @classmethod
+    def is_prime(cls, n: int) -> bool:
+        if n < 100:
+            return n in cls.primes100
+
+        if len(cls.prime_flags) <= n:
+            limit = max(2 * n, 1024)
+            flags = bytearray([1]) * limit
+            flags[0:2] = b'\0\0'
+
+            for p in range(2, int(limit ** 0.5) + 1):
+                if flags[p]:
+                    flags[p*p::p] = bytes(len(range(p*p, limit, p)))
+
+            cls.prime_flags = flags
+
+        return bool(cls.prime_flags[n])
+
     @abstractmethod
     def __init__(self) -> None:
         self._name: typing.Optional[str] = None
@@ -36,12 +138,30 @@ class Action(ABC):
         name = self._name
         return name
 
-    def Activate(self, elevator: Elevator) -> None:
-        okay = self._pre_check(elevator)
+    def Activate(
+        self,
+        elevator: Elevator,
+        rules: typing.Sequence['ElevatorRule'] = ()
+    ) -> None:
+        okay = (
+            self._pre_check(elevator)
+            and all(rule.allows(elevator, self) for rule in rules)
+        )
 
         if (okay):
+            start_floor = elevator.get_floor()
+
             self._push_button(elevator)
-            self._post_process
+            self._post_process(elevator)
+
+            # a rule may reject the move, then the elevator doesn't move (like
+            # a move out of range), but the press still counts
+
+            if not all(rule.accepts(elevator, self, start_floor) for rule in rules):
+                elevator.set_floor(start_floor)
+
+            for rule in rules:
+                rule.update(elevator, self, start_floor)
 
 
     def _pre_check(self, elevator: Elevator) -> bool:
@@ -77,7 +197,7 @@ class AButtonAction(Action):
         floor = elevator.get_floor()
         floor = floor + floor + 1
 
-        if floor <= MAX_FLOOR:
+        if floor <= elevator.layout.max_floor:
             if 0 == floor % 5:
                 floor //= 2
 
@@ -95,7 +215,7 @@ class BButtonAction(Action):
         floor = elevator.get_floor()
         floor += 4
 
-        if floor <= MAX_FLOOR:
+        if floor <= elevator.layout.max_floor:
             if 0 == floor % 2:
                 floor -= 3
 
@@ -115,10 +235,10 @@ class CButtonAction(Action):
         floor -= 7
 
         if 0 <= floor:
-            if floor in Action.primes100:
+            if Action.is_prime(floor):
                 floor += 10
 
-            if floor <= MAX_FLOOR:
+            if floor <= elevator.layout.max_floor:
                 elevator.set_floor(floor)
 
 
@@ -132,7 +252,7 @@ class DButtonAction(Action):
         floor = elevator.get_floor()
         floor = floor + 3 - (floor % 3)
 
-        if floor <= MAX_FLOOR:
+        if floor <= elevator.layout.max_floor:
             elevator.set_floor(floor)
 
 
@@ -146,10 +266,11 @@ class EButtonAction(Action):
 
         floor = elevator.get_floor()
 
+        max_floor = elevator.layout.max_floor
         floor += 2
 
-        if floor <= MAX_FLOOR:
-            if (1 == floor%2 and floor + 2 <= MAX_FLOOR):
+        if floor <= max_floor:
+            if (1 == floor%2 and floor + 2 <= max_floor):
                 floor += 2
 
             elevator.set_floor(floor)
@@ -163,12 +284,148 @@ button_actions: tuple[Action] = (
     EButtonAction()
 )
 
+# Stateful rules. A rule declares the counters it needs (added to the
+# elevator state layout), and hooks into each button press:
+#
+#   allows   before the press, False means the button can't be pressed
+#   accepts  after the move, False means the move is undone
+#   update   after the press, update the rule's counters
+
+class ElevatorRule(ABC):
+    def counters(self) -> tuple[tuple[str, int], ...]:
+        return ()
+
+    def allows(self, elevator: Elevator, button_action: Action) -> bool:
+        return True
+
+    def accepts(
+        self,
+        elevator: Elevator,
+        button_action: Action,
+        start_floor: int
+    ) -> bool:
+        return True
+
+    def update(
+        self,
+        elevator: Elevator,
+        button_action: Action,
+        start_floor: int
+    ) -> None:
+        pass
+
+
+class PressBudgetRule(ElevatorRule):
+    # A button can be pressed at most budget times.
+
+    def __init__(self, button_name: str, budget: int) -> None:
+        self.button_name = button_name
+        self.budget = budget
+        self.counter_name = f'presses_{button_name}'
+
+    def counters(self) -> tuple[tuple[str, int], ...]:
+        return ( (self.counter_name, self.budget + 1), )
+
+    def allows(self, elevator: Elevator, button_action: Action) -> bool:
+        return (
+            button_action.get_name() != self.button_name
+            or elevator.get_counter(self.counter_name) < self.budget
+        )
+
+    def update(self, elevator, button_action, start_floor) -> None:
+        if button_action.get_name() == self.button_name:
+            presses = elevator.get_counter(self.counter_name)
+            elevator.set_counter(self.counter_name, presses + 1)
+
+
+class TrapCooldownRule(ElevatorRule):
+    # After landing on trap_floor, the blocked buttons can't be pressed for
+    # the next cooldown presses.
+
+    def __init__(
+        self,
+        trap_floor: int,
+        cooldown: int,
+        blocked_buttons: str
+    ) -> None:
+        self.trap_floor = trap_floor
+        self.cooldown = cooldown
+        self.blocked_buttons = blocked_buttons
+        self.counter_name = f'cooldown_{trap_floor}'
+
+    def counters(self) -> tuple[tuple[str, int], ...]:
+        return ( (self.counter_name, self.cooldown + 1), )
+
+    def allows(self, elevator: Elevator, button_action: Action) -> bool:
+        return (
+            elevator.get_counter(self.counter_name) == 0
+            or button_action.get_name() not in self.blocked_buttons
+        )
+
+    def update(self, elevator, button_action, start_floor) -> None:
+        remaining = elevator.get_counter(self.counter_name)
+
+        if elevator.get_floor() == self.trap_floor:
+            remaining = self.cooldown
+        elif remaining:
+            remaining -= 1
+
+        elevator.set_counter(self.counter_name, remaining)
+
+
+class DirectionLockRule(ElevatorRule):
+    # After the elevator moves, it's locked to that direction for the next
+    # lock_presses presses (a move the other way is undone).
+
+    NONE, UP, DOWN = range(3)
+
+    def __init__(self, lock_presses: int) -> None:
+        self.lock_presses = lock_presses
+
+    def counters(self) -> tuple[tuple[str, int], ...]:
+        return (
+            ('lock_direction', 3),
+            ('lock_remaining', self.lock_presses + 1),
+        )
+
+    def direction(self, start_floor: int, floor: int) -> int:
+        if floor > start_floor:
+            return self.UP
+        elif floor < start_floor:
+            return self.DOWN
+        return self.NONE
+
+    def accepts(self, elevator, button_action, start_floor) -> bool:
+        moved = self.direction(start_floor, elevator.get_floor())
+
+        return (
+            moved == self.NONE
+            or elevator.get_counter('lock_remaining') == 0
+            or elevator.get_counter('lock_direction') == moved
+        )
+
+    def update(self, elevator, button_action, start_floor) -> None:
+        moved = self.direction(start_floor, elevator.get_floor())
+
+        if moved != self.NONE:
+            elevator.set_counter('lock_direction', moved)
+            elevator.set_counter('lock_remaining', self.lock_presses)
+        else:
+            remaining = elevator.get_counter('lock_remaining')
+            elevator.set_counter('lock_remaining', max(0, remaining - 1))
+
+
 class ElevatorAction:
-    def __init__(self, elevator: Elevator) -> None:
+    def __init__(
+        self,
+        elevator: Elevator,
+        rules: typing.Sequence[ElevatorRule] = ()
+    ) -> None:
         self.elevator = elevator.clone()
+        self.rules = rules
 
     def press_button(self, button_action: Action) -> int:
-        button_action.Activate(self.elevator)
+        button_action.Activate(self.elevator, self.rules)
         floor = self.get_floor()
         return floor
 
@@ -177,21 +434,33 @@ class ElevatorAction:
         return floor
 
     def clone(self) -> typing.Self:
-        elevator_action = ElevatorAction( self.elevator.clone() )
+        elevator_action = ElevatorAction( self.elevator.clone(), self.rules )
         return elevator_action
 
 
-# set of floors we've seen
-seen_floors: set[int] = { 0 }
+# A building: its rules, buttons, and the start and target floors. The state
+# layout is the floor plus every counter the rules need.
 
-# Above we've implemented reasonable state representation and transitions.
-# We need to implement a Breath first Search that tracks uses seen_floors.
+class Building:
+    def __init__(
+        self,
+        rules: typing.Sequence[ElevatorRule] = (),
+        start_floor: int = STARTING_FLOOR,
+        target_floor: int = TARGET_FLOOR,
+        max_floor: int = MAX_FLOOR,
+        actions: typing.Sequence[Action] = button_actions
+    ) -> None:
+        self.rules = tuple(rules)
+        self.start_floor = start_floor
+        self.target_floor = target_floor
+        self.actions = tuple(actions)
 
-# The total search space is 5^6 = 15,625 (we happen to know the shortest
-# path is 6 buttons).
+        counters = [c for rule in self.rules for c in rule.counters()]
+        self.layout = StateLayout(counters, max_floor)
 
+    def start_elevator(self) -> Elevator:
+        return Elevator(self.start_floor, self.layout)
 
-#  Build the elevator move table using a depth first search.
 
 class ElevatorMove(typing.NamedTuple):
     step: int           # how many buttons have been pressed
@@ -200,76 +469,132 @@ class ElevatorMove(typing.NamedTuple):
     end_floor: int
 
 
-elevator_move_table: typing.List[ElevatorMove] = [
-    ElevatorMove(0, 0, '', 0)
-]
+# Breadth first search over packed states, so the first time the target floor
+# is reached is a shortest path (fewest button presses).
+#
+# Memory stays compact when the product state space is large (tens of
+# millions of states):
+#
+#   * seen is a bitset over the whole packed state space (1 bit per state)
+#   * the BFS queue holds packed states in an array, with parallel arrays for
+#     the queue index of the parent state and the button pressed, used to
+#     rebuild the path (about 17 bytes per reached state)
+#
+# Returns the list of moves (empty if already on the target), or None if the
+# target can't be reached. start_floor and target_floor default to the
+# building's.
 
-def search_elevator_paths(move_elevator_start: ElevatorMove):
-    elevator_action_start = ElevatorAction(
-        Elevator(move_elevator_start.end_floor)
-    )
+def search_shortest_path(
+    building: Building,
+    start_floor: typing.Optional[int] = None,
+    target_floor: typing.Optional[int] = None
+) -> typing.Optional[list[ElevatorMove]]:
+    layout = building.layout
+    rules = building.rules
+    actions = building.actions
 
-    next_moves: typing.List[ElevatorMove] = []
+    if start_floor is None:
+        start_floor = building.start_floor
 
-    for button_action in button_actions:
-        cur_elevator_action = elevator_action_start.clone()
+    if target_floor is None:
+        target_floor = building.target_floor
 
-        floor = cur_elevator_action.press_button(button_action)
+    if not (0 <= start_floor <= layout.max_floor):
+        raise ValueError(f'Start floor out of range: {start_floor}')
 
-        elevator_move = ElevatorMove(
-            move_elevator_start.step + 1,
-            move_elevator_start.end_floor,
-            move_elevator_start.action_sequence + button_action.get_name(),
-            floor
-        )
+    seen = bytearray((layout.state_count + 7) // 8)
 
-        if (floor not in seen_floors):
-            seen_floors.add(floor)
-            elevator_move_table.append( elevator_move )
-            next_moves.append( elevator_move )
+    start_state = Elevator(start_floor, layout).pack()
+    seen[start_state >> 3] |= 1 << (start_state & 7)
 
-            print(f'new: {elevator_move}')
+    queue_states = array('q', [start_state])
+    queue_parents = array('q', [-1])
+    queue_actions = bytearray([0])
 
-        else:
-            print( f'  old: {elevator_move}' )
+    ihead = 0
+    itarget = None
+
+    if start_floor == target_floor:
+        itarget = 0
+
+    while itarget is None and ihead < len(queue_states):
+        elevator = Elevator.from_packed(layout, queue_states[ihead])
 
-        if floor == TARGET_FLOOR:
-            print( f'Hit target in {elevator_move.step} steps' )
-            break
+        for iaction, button_action in enumerate(actions):
+            next_elevator = elevator.clone()
+            button_action.Activate(next_elevator, rules)
 
-    fcontinue = floor != TARGET_FLOOR
+            state = next_elevator.pack()
+            mask = 1 << (state & 7)
 
-    # TODO: make this iterate instead of recurse.
+            if seen[state >> 3] & mask:
+                continue
 
-    if (fcontinue):
-        for move in next_moves:
-            fcontinue = search_elevator_paths( move )
-            if not fcontinue:
+            seen[state >> 3] |= mask
+
+            queue_states.append(state)
+            queue_parents.append(ihead)
+            queue_actions.append(iaction)
+
+            if next_elevator.get_floor() == target_floor:
+                itarget = len(queue_states) - 1
                 break
 
-    return fcontinue
+        ihead += 1
 
-fcontinue = search_elevator_paths( elevator_move_table[0] )
+    if itarget is None:
+        return None
 
-# elevator_move_table
+    # walk back to the start, then build the moves
 
-# elevator_move_table is ordered and the last entry ends on the target
+    path = []
+    i = itarget
 
-solution_sequence = elevator_move_table[-1].action_sequence
+    while 0 < i:
+        path.append(i)
+        i = queue_parents[i]
 
-sol_seq_set = set(
-    [solution_sequence[:i+1] for i in range(len(solution_sequence))]
-)
+    path.reverse()
+
+    moves: list[ElevatorMove] = []
+    action_sequence = ''
+
+    for step, i in enumerate(path, 1):
+        action_sequence += actions[queue_actions[i]].get_name()
+        end_floor = layout.unpack(queue_states[i])[0]
+        moves.append( ElevatorMove(step, start_floor, action_sequence, end_floor) )
+        start_floor = end_floor
+
+    return moves
+
+
+def print_moves(moves: typing.Optional[list[ElevatorMove]]) -> None:
+    if moves is None:
+        print('Target can not be reached')
+        return
+
+    print( f'Hit target in {len(moves)} steps' )
+
+    for sm in moves:
+        print(
+            f'{sm.step}. {sm.start_floor:02} -- '
+            f'{sm.action_sequence[-1]} --> {sm.end_floor:02}'
+        )
+
+
+def main() -> None:
+    print_moves( search_shortest_path(Building()) )
+
+    # The same puzzle with stateful rules, e.g. button A may only be pressed
+    # twice, and after a move the elevator can't reverse for 2 presses.
 
-solution_moves = [
-    e for e in elevator_move_table if
-    e.action_sequence in sol_seq_set
-]
+    print()
 
-for sm in solution_moves:
-    print(
-        f'{sm.step}. {sm.start_floor:02} -- '
-        f'{sm.action_sequence[-1]} --> {sm.end_floor:02}'
-    )
+    print_moves( search_shortest_path( Building( [
+        PressBudgetRule('A', 2),
+        DirectionLockRule(2),
+    ] ) ) )
 
 
+if __name__ == '__main__':
+    main()
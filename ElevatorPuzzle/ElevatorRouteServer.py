@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+
+# Elevator route query server.
+#
+# Loads one or more building rule sets at startup, then answers shortest path
+# queries over a Unix socket or localhost TCP. Answers come from an LRU cache
+# in front of search_shortest_path (ElevatorPuzzle.py). A cache miss is solved
+# in a worker process, so the event loop keeps answering other queries
+# meanwhile. Only buildings with a tiny packed state space (below
+# --offload-states, default 32) are solved inline: the search costs about
+# 25 us per state, so these stay under a millisecond even when the target is
+# unreachable. Concurrent queries for the same route share one search.
+#
+# Start and target floors must be ints in [0, max_floor], anything else is
+# rejected before the cache is consulted.
+#
+# The protocol is NDJSON (one JSON object per line) in both directions.
+# Responses carry the request "id" and may arrive out of order.
+#
+# Requests:
+#
+#   {"id": 1, "building": "skyscraper", "start": 0, "target": 30}
+#   {"id": 2, "op": "metrics"}
+#   {"id": 3, "op": "buildings"}
+#
+#   "start" and "target" default to the building's own floors.
+#
+# Responses:
+#
+#   {"id": 1, "building": "skyscraper", "start": 0, "target": 30,
+#    "reachable": true, "presses": "ABAABD",
+#    "moves": [[0, "A", 1], [1, "B", 5], ...], "cached": false}
+#   {"id": 2, "metrics": {...}}
+#   {"id": 4, "error": "KeyError: 'Unknown building: lobby'"}
+#
+# Building rule sets are JSON, see buildings.json:
+#
+#   {"buildings": [{"name": "...", "max_floor": 30, "start_floor": 0,
+#     "target_floor": 30, "rules": [{"rule": "press_budget", "button_name": "A",
+#     "budget": 2}, ...]}]}
+
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import ElevatorPuzzle
+
+
+rule_types = {
+    'press_budget': ElevatorPuzzle.PressBudgetRule,
+    'trap_cooldown': ElevatorPuzzle.TrapCooldownRule,
+    'direction_lock': ElevatorPuzzle.DirectionLockRule,
+}
+
+default_buildings_path = os.path.join(os.path.dirname(__file__), 'buildings.json')
+
+
+def compile_building(spec):
+    rules = []
+
+    for rule_spec in spec.get('rules', ()):
+        rule_spec = dict(rule_spec)
+        rule_name = rule_spec.pop('rule')
+
+        if rule_name not in rule_types:
+            raise ValueError(f"Building {spec['name']}: unknown rule {rule_name!r}")
+
+        rules.append( rule_types[rule_name](**rule_spec) )
+
+    max_floor = spec.get('max_floor', ElevatorPuzzle.MAX_FLOOR)
+
+    building = ElevatorPuzzle.Building(
+        rules,
+        start_floor=spec.get('start_floor', ElevatorPuzzle.STARTING_FLOOR),
+        target_floor=spec.get('target_floor', max_floor),
+        max_floor=max_floor
+    )
+
+    return building
+
+
+def load_building_specs(paths):
+    specs = {}
+
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for spec in json.load(f)['buildings']:
+                specs[spec['name']] = spec
+
+    return specs
+
+
+# Compiled buildings by name. Set in the server process, and in each worker
+# process by load_worker.
+
+buildings = {}
+
+
+def load_worker(specs):
+    buildings.update( (name, compile_building(spec)) for name, spec in specs.items() )
+
+
+# Returns a list of [start_floor, button, end_floor] moves, or None if the
+# target can't be reached. Runs inline or in a worker process.
+
+def find_route(name, start_floor, target_floor):
+    moves = ElevatorPuzzle.search_shortest_path(
+        buildings[name],
+        start_floor,
+        target_floor
+    )
+
+    if moves is None:
+        return None
+
+    return [
+        [move.start_floor, move.action_sequence[-1], move.end_floor]
+        for move in moves
+    ]
+
+
+# LRU of route results, keyed by (building, start, target)
+
+class RouteCache:
+    def __init__(self, max_entries=65536):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        try:
+            route = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return False, None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True, route
+
+    def store(self, key, route):
+        self.entries[key] = route
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class Metrics:
+    def __init__(self, latency_window=10000):
+        self.start_time = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.offloaded = 0
+        self.shared = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latencies = deque(maxlen=latency_window)
+
+    def record(self, seconds):
+        self.requests += 1
+        self.latency_total += seconds
+        self.latency_max = max(self.latency_max, seconds)
+        self.latencies.append(seconds)
+
+    def percentile(self, sorted_latencies, fraction):
+        if not sorted_latencies:
+            return 0.0
+
+        i = min(len(sorted_latencies) - 1, int(fraction * len(sorted_latencies)))
+        return sorted_latencies[i]
+
+    def summary(self, cache):
+        recent = sorted(self.latencies)
+        lookups = cache.hits + cache.misses
+
+        return {
+            'uptime_seconds': round(time.monotonic() - self.start_time, 3),
+            'requests': self.requests,
+            'errors': self.errors,
+            'cache_hits': cache.hits,
+            'cache_misses': cache.misses,
+            'cache_hit_rate': round(cache.hits / lookups, 6) if lookups else 0.0,
+            'cache_entries': len(cache.entries),
+            'offloaded': self.offloaded,
+            'shared_searches': self.shared,
+            'latency_ms': {
+                'mean': round(1000 * self.latency_total / max(1, self.requests), 6),
+                'p50': round(1000 * self.percentile(recent, 0.50), 6),
+                'p90': round(1000 * self.percentile(recent, 0.90), 6),
+                'p99': round(1000 * self.percentile(recent, 0.99), 6),
+                'max': round(1000 * self.latency_max, 6),
+            },
+        }
+
+
+class RouteServer:
+    def __init__(self, specs, cache_size=65536, offload_states=32, workers=None):
+        self.specs = specs
+        self.offload_states = offload_states
+        self.workers = workers
+        self.cache = RouteCache(cache_size)
+        self.metrics = Metrics()
+        self.in_flight = {}
+        self.executor = None
+
+        load_worker(specs)
+
+    def start_executor(self):
+        self.executor = ProcessPoolExecutor(
+            self.workers,
+            initializer=load_worker,
+            initargs=(self.specs,)
+        )
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def route(self, name, start_floor, target_floor):
+        building = buildings.get(name)
+
+        if building is None:
+            raise KeyError(f'Unknown building: {name}')
+
+        if start_floor is None:
+            start_floor = building.start_floor
+        if target_floor is None:
+            target_floor = building.target_floor
+
+        for floor in (start_floor, target_floor):
+            if (
+                type(floor) is not int
+                or not (0 <= floor <= building.layout.max_floor)
+            ):
+                raise ValueError(
+                    f'Floor must be an int from 0 to {building.layout.max_floor}: '
+                    f'{floor!r}'
+                )
+
+        key = (name, start_floor, target_floor)
+        found, route = self.cache.lookup(key)
+
+        if found:
+            return key, route, True
+
+        # someone is already searching for this route, wait for their result
+
+        if key in self.in_flight:
+            self.metrics.shared += 1
+            route = await asyncio.shield(self.in_flight[key])
+            return key, route, False
+
+        if self.executor and building.layout.state_count >= self.offload_states:
+            self.metrics.offloaded += 1
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, find_route, *key
+            )
+        else:
+            future = asyncio.get_running_loop().create_future()
+
+            try:
+                future.set_result( find_route(*key) )
+            except Exception as e:
+                future.set_exception(e)
+
+        self.in_flight[key] = future
+
+        try:
+            route = await future
+        finally:
+            del self.in_flight[key]
+
+        self.cache.store(key, route)
+
+        return key, route, False
+
+    async def handle_request(self, line):
+        start_time = time.perf_counter()
+        response = {}
+
+        try:
+            request = json.loads(line)
+            response['id'] = request.get('id')
+            op = request.get('op', 'route')
+
+            if op == 'route':
+                key, route, cached = await self.route(
+                    request['building'],
+                    request.get('start'),
+                    request.get('target')
+                )
+
+                response['building'], response['start'], response['target'] = key
+                response['reachable'] = route is not None
+
+                if route is not None:
+                    response['presses'] = ''.join(button for _, button, _ in route)
+                    response['moves'] = route
+
+                response['cached'] = cached
+
+            elif op == 'metrics':
+                response['metrics'] = self.metrics.summary(self.cache)
+
+            elif op == 'buildings':
+                response['buildings'] = {
+                    name: {
+                        'max_floor': b.layout.max_floor,
+                        'start_floor': b.start_floor,
+                        'target_floor': b.target_floor,
+                        'state_count': b.layout.state_count,
+                    }
+                    for name, b in buildings.items()
+                }
+
+            else:
+                raise ValueError(f'Unknown op: {op}')
+
+        except Exception as e:
+            self.metrics.errors += 1
+            response['error'] = f"{type(e).__name__}: {e}"
+
+        self.metrics.record(time.perf_counter() - start_time)
+
+        return response
+
+    async def handle_connection(self, reader, writer):
+        tasks = set()
+
+        async def respond(line):
+            response = await self.handle_request(line)
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                if not line.strip():
+                    continue
+
+                task = asyncio.create_task(respond(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        except ConnectionError:
+            pass
+
+        finally:
+            writer.close()
+
+
+async def serve(args):
+    paths = args.buildings or [default_buildings_path]
+    server = RouteServer(
+        load_building_specs(paths),
+        cache_size=args.cache_size,
+        offload_states=args.offload_states,
+        workers=args.workers
+    )
+    server.start_executor()
+
+    if args.unix:
+        listener = await asyncio.start_unix_server(server.handle_connection, args.unix)
+        where = args.unix
+    else:
+        listener = await asyncio.start_server(server.handle_connection, args.host, args.port)
+        where = f'{args.host}:{args.port}'
+
+    print(f'Serving {len(buildings)} buildings on {where}', file=sys.stderr)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with listener:
+        await stop.wait()
+
+    server.shutdown()
+
+    if args.unix and os.path.exists(args.unix):
+        os.unlink(args.unix)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Answer elevator shortest route queries over a socket.'
+    )
+    parser.add_argument('--buildings', action='append', metavar='JSON_FILE',
+        help='building rule sets, may be repeated (default: buildings.json)')
+    parser.add_argument('--unix', metavar='PATH',
+        help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cache-size', type=int, default=65536,
+        help='routes kept in the LRU cache')
+    parser.add_argument('--offload-states', type=int, default=32,
+        help='solve buildings with fewer packed states inline, the rest '
+            'in worker processes')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+        help='worker processes (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    asyncio.run(serve(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+
+# Batch puzzle solving service.
+#
+# Reads puzzles as NDJSON (one JSON object per line) from a file or stdin and
+# dispatches them to a pool of worker processes. Each worker is warmed up when
+# the pool starts (solver modules imported, including python-constraint, and
+# one puzzle solved), so a job only pays for its own search.
+#
+# Results are written to stdout as NDJSON, in input order, as soon as they are
+# ready. At most --max-pending jobs are in flight at once, so memory stays
+# bounded however large the input is.
+#
+# Input records:
+#
+#   {"id": "p1", "puzzle": "<puzzle text>", "backend": "pure"}
+#   {"id": "p2", "file": "wizards.puzzle"}
+#
+#   "puzzle" is text in the LogicGridPuzzle.py format, "file" names a puzzle
+#   file instead. "id" (default: input line number) and "backend" (default:
+#   --backend) are optional.
+#
+# Output records:
+#
+#   {"id": "p1", "backend": "pure", "solution_count": 3, "solutions": [...],
+#    "seconds": 0.0042, "stats": {...}}
+#   {"id": "p2", "error": "Line 3: Unknown member 'Foo'"}
+#
+#   Each solution is a list of rows, each row a list of member names (one per
+#   category). "seconds" covers the search only, not loading the puzzle.
+
+import os
+import sys
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import LogicGridPuzzle
+
+
+# Solve a loaded puzzle, returning (solutions, stats). Solutions use member
+# names, so every backend reports the same form.
+
+def solve_pure(puzzle):
+    import SolveWizardsPuzzlePure
+
+    stats = SolveWizardsPuzzlePure.search_stats()
+
+    solution_list = SolveWizardsPuzzlePure.solve(
+        puzzle.start_state(),
+        puzzle.rules,
+        stats=stats
+    )
+
+    solutions = [
+        [
+            [
+                ','.join(sorted(puzzle.get_member_name(icol, m.value) for m in c))
+                for icol, c in enumerate(row)
+            ]
+            for row in solution
+        ]
+        for solution in solution_list
+    ]
+
+    return solutions, stats
+
+
+def solve_constraint(puzzle):
+    import SolveWizardsPuzzleConstraint
+
+    categories, clues = SolveWizardsPuzzleConstraint.puzzle_model(puzzle)
+    stats = SolveWizardsPuzzleConstraint.search_stats()
+
+    solution_tables = SolveWizardsPuzzleConstraint.solve(
+        categories,
+        clues,
+        stats=stats
+    )
+
+    # constraint variable names may be qualified (Category.Member)
+
+    member_names = {
+        var: puzzle.get_member_name(icol, imember)
+        for icol, members in enumerate(categories)
+        for imember, var in enumerate(members)
+    }
+
+    solutions = [
+        [ [member_names[v] for v in row] for row in solution_table ]
+        for solution_table in solution_tables
+    ]
+
+    return solutions, stats
+
+
+def solve_sat(puzzle):
+    import SolveWizardsPuzzleSat
+
+    stats = {}
+
+    solutions = [
+        [
+            [puzzle.get_member_name(icol, m) for icol, m in enumerate(row)]
+            for row in solution
+        ]
+        for solution in SolveWizardsPuzzleSat.solve_puzzle(puzzle, stats=stats)
+    ]
+
+    return solutions, stats
+
+
+backends = {
+    'pure': solve_pure,
+    'constraint': solve_constraint,
+    'sat': solve_sat,
+}
+
+
+# Worker process state, set by warm_worker
+
+worker_backend = 'pure'
+worker_cache_dir = LogicGridPuzzle.default_cache_dir
+
+warmup_puzzle_path = os.path.join(os.path.dirname(__file__), 'wizards.puzzle')
+
+
+def warm_worker(backend, cache_dir):
+    global worker_backend, worker_cache_dir
+
+    worker_backend = backend
+    worker_cache_dir = cache_dir
+
+    import SolveWizardsPuzzlePure
+    SolveWizardsPuzzlePure.trace = False
+
+    # python-constraint is optional, jobs asking for it report the import error
+
+    try:
+        import SolveWizardsPuzzleConstraint
+    except ImportError:
+        pass
+
+    import SolveWizardsPuzzleSat
+
+    # Solve once so everything the default backend touches is loaded. An
+    # error raised here would break the whole pool, so it's ignored: jobs
+    # using the backend hit the same error and report it in their results.
+
+    try:
+        if os.path.exists(warmup_puzzle_path):
+            backends[backend]( LogicGridPuzzle.load_puzzle(warmup_puzzle_path, cache_dir) )
+    except Exception:
+        pass
+
+
+def solve_job(line_num, line):
+    result = {'id': line_num}
+
+    try:
+        job = json.loads(line)
+        result['id'] = job.get('id', line_num)
+
+        if 'puzzle' in job:
+            puzzle = LogicGridPuzzle.load_puzzle_text(
+                job['puzzle'], cache_dir=worker_cache_dir
+            )
+        else:
+            puzzle = LogicGridPuzzle.load_puzzle(job['file'], worker_cache_dir)
+
+        backend = job.get('backend', worker_backend)
+        result['backend'] = backend
+
+        start_time = time.perf_counter()
+        solutions, stats = backends[backend](puzzle)
+        seconds = time.perf_counter() - start_time
+
+        result['solution_count'] = len(solutions)
+        result['solutions'] = solutions
+        result['seconds'] = round(seconds, 6)
+        result['stats'] = stats
+
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+
+    return result
+
+
+def write_result(out_file, result, include_solutions):
+    if not include_solutions:
+        result.pop('solutions', None)
+
+    out_file.write(json.dumps(result) + '\n')
+    out_file.flush()
+
+
+def run_batch(in_file, out_file, workers=None, backend='pure',
+        max_pending=None, cache_dir=LogicGridPuzzle.default_cache_dir,
+        include_solutions=True):
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 4 * workers
+
+    with ProcessPoolExecutor(
+        workers,
+        initializer=warm_worker,
+        initargs=(backend, cache_dir)
+    ) as executor:
+        pending = deque()
+
+        for line_num, line in enumerate(in_file, 1):
+            if not line.strip():
+                continue
+
+            pending.append( executor.submit(solve_job, line_num, line) )
+
+            # keep input order: wait for the oldest job when the window is full
+
+            if len(pending) >= max_pending:
+                write_result(out_file, pending.popleft().result(), include_solutions)
+
+        while pending:
+            write_result(out_file, pending.popleft().result(), include_solutions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Solve logic grid puzzles read as NDJSON.'
+    )
+    parser.add_argument('input', nargs='?', default='-',
+        help='NDJSON input file (default: stdin)')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+        help='worker processes (default: CPU count)')
+    parser.add_argument('--backend', choices=sorted(backends), default='pure')
+    parser.add_argument('--max-pending', type=int, default=None,
+        help='jobs in flight at once (default: 4 per worker)')
+    parser.add_argument('--no-disk-cache', action='store_true',
+        help='do not cache compiled puzzles on disk')
+    parser.add_argument('--counts-only', action='store_true',
+        help='omit solutions from the output')
+    args = parser.parse_args(argv)
+
+    cache_dir = None if args.no_disk_cache else LogicGridPuzzle.default_cache_dir
+
+    in_file = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+
+    with in_file:
+        run_batch(
+            in_file,
+            sys.stdout,
+            workers=args.workers,
+            backend=args.backend,
+            max_pending=args.max_pending,
+            cache_dir=cache_dir,
+            include_solutions=not args.counts_only
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+# Differential test harness for the puzzle solver backends.
+#
+# Generates random puzzles, solves each one with every backend (pure,
+# constraint, sat, see BatchSolve.py) in parallel worker processes, and checks
+# that all backends find exactly the same set of solutions. Per backend timing
+# is recorded too, so a performance change to any backend can be checked for
+# correctness and speed in one run.
+#
+# Random puzzles are a random solution grid plus a random subset of clues true
+# for it (see GeneratePuzzle.py), and sometimes a random clue that may be
+# false, so puzzles with no solution and with several solutions are covered
+# as well as unique ones.
+#
+# The built in wizards puzzle is always checked first. Each backend solves its
+# own encoding of it (raw_rules in SolveWizardsPuzzlePure.py, clues in
+# SolveWizardsPuzzleConstraint.py, and wizards.puzzle for the others), so
+# encodings drifting apart show up as a mismatch.
+#
+# Exits with status 1 if any puzzle has a mismatch or error.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import BatchSolve
+import GeneratePuzzle
+import LogicGridPuzzle
+
+
+builtin_puzzle_id = 'wizards'
+
+
+# A random puzzle, not minimized. keep is the fraction of the clue pool kept.
+
+def random_puzzle(nrows, ncols, rng):
+    solution = GeneratePuzzle.random_solution(nrows, ncols, rng)
+    pool = GeneratePuzzle.clue_pool(solution, rng, nrows * ncols)
+
+    keep = rng.uniform(0.4, 0.9)
+    clues = rng.sample(pool, max(1, int(keep * len(pool))))
+
+    if rng.random() < 0.25:
+        a, b = rng.sample(range(ncols), 2)
+        targets = frozenset(rng.sample(range(nrows), rng.randint(1, nrows - 1)))
+        clues.insert(rng.randrange(len(clues) + 1), (a, rng.randrange(nrows), b, targets))
+
+    text = GeneratePuzzle.format_puzzle(nrows, ncols, clues)
+    return text
+
+
+# Each backend's own encoding of the wizards puzzle
+
+def solve_builtin(backend):
+    if backend == 'pure':
+        import SolveWizardsPuzzlePure as pure
+
+        solutions = [
+            [[next(iter(c)).name for c in row] for row in solution]
+            for solution in pure.solve(pure.start_state)
+        ]
+    elif backend == 'constraint':
+        import SolveWizardsPuzzleConstraint as constraint
+
+        solutions = constraint.solve(constraint.categories, constraint.clues)
+    else:
+        puzzle = LogicGridPuzzle.load_puzzle(BatchSolve.warmup_puzzle_path, None)
+        solutions, stats = BatchSolve.backends[backend](puzzle)
+
+    return solutions
+
+
+# Runs in a worker process. Returns (puzzle_id, backend, solution set or
+# None, seconds, error message or None).
+
+def run_job(puzzle_id, backend, text):
+    start_time = time.perf_counter()
+
+    try:
+        if text is None:
+            solutions = solve_builtin(backend)
+        else:
+            puzzle = LogicGridPuzzle.load_puzzle_text(text, cache_dir=None)
+            solutions, stats = BatchSolve.backends[backend](puzzle)
+
+        solution_set = frozenset(
+            tuple(tuple(name.lower() for name in row) for row in solution)
+            for solution in solutions
+        )
+        error = None
+
+    except Exception as e:
+        solution_set = None
+        error = f"{type(e).__name__}: {e}"
+
+    seconds = time.perf_counter() - start_time
+
+    return puzzle_id, backend, solution_set, seconds, error
+
+
+def parse_size(size):
+    nrows, ncols = size.lower().split('x')
+    return int(nrows), int(ncols)
+
+
+def generate_jobs(args, backends):
+    rng = random.Random(args.seed)
+    sizes = [parse_size(s) for s in args.sizes.split(',')]
+
+    yield builtin_puzzle_id, None
+
+    for ipuzzle in range(args.count):
+        nrows, ncols = rng.choice(sizes)
+        yield f"{ipuzzle}-{nrows}x{ncols}", random_puzzle(nrows, ncols, rng)
+
+
+class Report:
+    def __init__(self, backends):
+        self.backends = backends
+        self.puzzle_count = 0
+        self.mismatches = []
+        self.seconds = {b: 0.0 for b in backends}
+        self.max_seconds = {b: 0.0 for b in backends}
+        self.solution_counts = {}
+
+    # Called with every backend's results for one puzzle
+
+    def add(self, puzzle_id, text, results):
+        self.puzzle_count += 1
+
+        for backend, (solution_set, seconds, error) in results.items():
+            self.seconds[backend] += seconds
+            self.max_seconds[backend] = max(self.max_seconds[backend], seconds)
+
+        outcomes = {
+            backend: error if error else solution_set
+            for backend, (solution_set, seconds, error) in results.items()
+        }
+
+        reference = outcomes[self.backends[0]]
+
+        if all(
+            outcome == reference and not isinstance(outcome, str)
+            for outcome in outcomes.values()
+        ):
+            n = len(reference)
+            self.solution_counts[n] = self.solution_counts.get(n, 0) + 1
+            return
+
+        self.mismatches.append( {
+            'id': puzzle_id,
+            'puzzle': text,
+            'outcomes': {
+                backend: outcome if isinstance(outcome, str)
+                    else f"{len(outcome)} solutions"
+                for backend, outcome in outcomes.items()
+            },
+            'differences': {
+                backend: sorted(map(list, outcome ^ reference))[:3]
+                for backend, outcome in outcomes.items()
+                if not isinstance(outcome, str)
+                    and not isinstance(reference, str)
+                    and outcome != reference
+            },
+        } )
+
+    def summary(self):
+        return {
+            'puzzles': self.puzzle_count,
+            'mismatches': len(self.mismatches),
+            'solution_counts': dict(sorted(self.solution_counts.items())),
+            'timing': {
+                backend: {
+                    'total_seconds': round(self.seconds[backend], 6),
+                    'mean_seconds': round(
+                        self.seconds[backend] / max(1, self.puzzle_count), 6
+                    ),
+                    'max_seconds': round(self.max_seconds[backend], 6),
+                }
+                for backend in self.backends
+            },
+        }
+
+    def print(self, out_file=sys.stdout):
+        summary = self.summary()
+
+        for mismatch in self.mismatches:
+            out_file.write(f"MISMATCH: {mismatch['id']}\n")
+            for backend, outcome in mismatch['outcomes'].items():
+                out_file.write(f"  {backend.ljust(11)} {outcome}\n")
+            for backend, differences in mismatch['differences'].items():
+                out_file.write(f"  {backend} differs, e.g. {differences[0]}\n")
+            if mismatch['puzzle']:
+                out_file.write(''.join(
+                    f"    {line}\n" for line in mismatch['puzzle'].splitlines()
+                ))
+            out_file.write('\n')
+
+        out_file.write(
+            f"{summary['puzzles']} puzzles, {summary['mismatches']} mismatches, "
+            f"solution counts {summary['solution_counts']}\n\n"
+        )
+
+        for backend, timing in summary['timing'].items():
+            out_file.write(
+                f"{backend.ljust(11)} total {timing['total_seconds']:9.3f} s"
+                f"  mean {timing['mean_seconds']*1000:9.3f} ms"
+                f"  max {timing['max_seconds']*1000:9.3f} ms\n"
+            )
+
+
+def run_harness(args):
+    backends = args.backends.split(',')
+    report = Report(backends)
+
+    workers = args.workers or os.cpu_count() or 1
+    max_pending = 4 * workers * len(backends)
+
+    texts = {}
+    results = {}
+    pending = set()
+
+    def collect(done):
+        for future in done:
+            puzzle_id, backend, solution_set, seconds, error = future.result()
+            puzzle_results = results.setdefault(puzzle_id, {})
+            puzzle_results[backend] = (solution_set, seconds, error)
+
+            if len(puzzle_results) == len(backends):
+                report.add(puzzle_id, texts.pop(puzzle_id), results.pop(puzzle_id))
+
+    with ProcessPoolExecutor(
+        workers,
+        initializer=BatchSolve.warm_worker,
+        initargs=(backends[0], None)
+    ) as executor:
+        for puzzle_id, text in generate_jobs(args, backends):
+            texts[puzzle_id] = text
+
+            for backend in backends:
+                pending.add( executor.submit(run_job, puzzle_id, backend, text) )
+
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        done, pending = wait(pending)
+        collect(done)
+
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check that every solver backend finds the same solutions.'
+    )
+    parser.add_argument('--count', type=int, default=200,
+        help='random puzzles to generate')
+    parser.add_argument('--sizes', default='4x3,5x3,5x4,6x4',
+        help='comma separated puzzle sizes, rows x categories')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--backends', default=','.join(BatchSolve.backends),
+        help='comma separated backends (default: all)')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+        help='worker processes (default: CPU count)')
+    parser.add_argument('--report', metavar='JSON_FILE',
+        help='also write the summary and mismatches as JSON')
+    args = parser.parse_args(argv)
+
+    report = run_harness(args)
+    report.print()
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(
+                dict(report.summary(), mismatch_details=report.mismatches),
+                f,
+                indent=2
+            )
+
+    sys.exit(1 if report.mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
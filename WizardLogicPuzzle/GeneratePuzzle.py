@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+
+# Generate wizard style logic grid puzzles with a unique solution.
+#
+# We start from a random solution grid and a pool of clues that are true for
+# it (enough to make the solution unique), then remove clues for as long as
+# the solution stays unique. The result is a puzzle where every clue is needed.
+#
+# Each removal needs a uniqueness check. Running search_state for every check
+# is far too slow for larger grids, so this module has its own propagation
+# engine working on bit masks, and reuses propagation state between checks:
+#
+#   * Clues are tested for removal in a fixed (random) order c[0] .. c[n-1].
+#     Testing c[i] means solving with the kept clues (from c[0] .. c[i-1])
+#     plus all of c[i+1] .. c[n-1].
+#
+#   * Propagation only ever removes members, so a state propagated with a
+#     subset of the clues is a valid starting point for any superset. We
+#     propagate the suffixes c[i+1] .. c[n-1] once up front (each from the
+#     next one, adding a single clue), and keep a state propagated with the
+#     kept clues, updated as each clue is added. A check starts from the
+#     intersection of the two and only has to propagate what's new.
+#
+#   * The search stops at the second solution.
+#
+# Puzzles are written in the LogicGridPuzzle.py format.
+
+import sys
+import json
+import random
+import argparse
+
+
+# A rule in bit mask form: (icol_match, match_bit, icol_target, target_mask).
+# Same meaning as the pure solver rules, the row with match_bit in column
+# icol_match has one of target_mask in column icol_target.
+#
+# The grid state is a flat list of masks, cells[row * ncols + col].
+
+class GridSolver:
+    def __init__(self, nrows, ncols):
+        self.nrows = nrows
+        self.ncols = ncols
+        self.full = (1 << nrows) - 1
+
+    # start state, first column pinned (one member per row)
+
+    def start_state(self):
+        cells = []
+
+        for r in range(self.nrows):
+            cells.append(1 << r)
+            cells += [self.full] * (self.ncols - 1)
+
+        return cells
+
+    # Apply rules and the all different constraints until nothing changes.
+    # Returns False if a cell becomes empty (no solution from this state).
+
+    def propagate(self, cells, rules):
+        nrows = self.nrows
+        ncols = self.ncols
+        row_range = range(nrows)
+
+        changed = True
+
+        while changed:
+            changed = False
+
+            for icol_match, match_bit, icol_target, target_mask in rules:
+                match_rows = []
+
+                for r in row_range:
+                    imatch = r * ncols + icol_match
+
+                    if cells[imatch] & match_bit:
+
+                        # contrapositive, no target here so no match here
+
+                        if not cells[r * ncols + icol_target] & target_mask:
+                            cells[imatch] &= ~match_bit
+                            if not cells[imatch]:
+                                return False
+                            changed = True
+                        else:
+                            match_rows.append(r)
+
+                if not match_rows:
+                    return False
+
+                # only one row left for the match, apply the target there
+
+                if 1 == len(match_rows):
+                    r = match_rows[0]
+                    imatch = r * ncols + icol_match
+                    itarget = r * ncols + icol_target
+
+                    if cells[imatch] != match_bit:
+                        cells[imatch] = match_bit
+                        changed = True
+
+                    if cells[itarget] & ~target_mask:
+                        cells[itarget] &= target_mask
+                        changed = True
+
+                # single target, the rule commutes
+
+                if 1 == target_mask.bit_count():
+                    for r in row_range:
+                        itarget = r * ncols + icol_target
+
+                        if (
+                            cells[itarget] & target_mask
+                            and not cells[r * ncols + icol_match] & match_bit
+                        ):
+                            cells[itarget] &= ~target_mask
+                            if not cells[itarget]:
+                                return False
+                            changed = True
+
+            # all different, per column: naked and hidden singles
+
+            for c in range(1, ncols):
+                column = range(c, nrows * ncols, ncols)
+
+                for i in column:
+                    m = cells[i]
+                    if 1 == m.bit_count():
+                        for j in column:
+                            if j != i and cells[j] & m:
+                                cells[j] &= ~m
+                                if not cells[j]:
+                                    return False
+                                changed = True
+
+                for b in row_range:
+                    bit = 1 << b
+                    holders = [i for i in column if cells[i] & bit]
+
+                    if not holders:
+                        return False
+
+                    if 1 == len(holders) and cells[holders[0]] != bit:
+                        cells[holders[0]] = bit
+                        changed = True
+
+        return True
+
+    # Count solutions from cells (already a copy, it's modified), stopping
+    # once limit is reached.
+
+    def count_solutions(self, cells, rules, limit=2):
+        if not self.propagate(cells, rules):
+            return 0
+
+        # branch on the smallest unsolved cell
+
+        best = None
+        best_count = self.nrows + 1
+
+        for i, m in enumerate(cells):
+            n = m.bit_count()
+            if 1 < n < best_count:
+                best = i
+                best_count = n
+
+        if best is None:
+            return 1
+
+        count = 0
+        remaining = cells[best]
+
+        while remaining and count < limit:
+            bit = remaining & -remaining
+            remaining ^= bit
+
+            trial = cells.copy()
+            trial[best] = bit
+            count += self.count_solutions(trial, rules, limit - count)
+
+        return count
+
+
+# A random solution, solution[row][col] is the member index (column 0 is the
+# row index).
+
+def random_solution(nrows, ncols, rng):
+    perms = [list(range(nrows))]
+
+    for c in range(1, ncols):
+        perm = list(range(nrows))
+        rng.shuffle(perm)
+        perms.append(perm)
+
+    solution = [[perms[c][r] for c in range(ncols)] for r in range(nrows)]
+    return solution
+
+
+# Clues true for the solution, as (icol_match, imember, icol_target,
+# frozenset(target members)). All the equal clues (which alone make the
+# solution unique), plus extra_count random not equal and one of clues.
+
+def clue_pool(solution, rng, extra_count):
+    nrows = len(solution)
+    ncols = len(solution[0])
+
+    clues = [
+        (a, solution[r][a], b, frozenset([solution[r][b]]))
+        for r in range(nrows)
+        for a in range(ncols)
+        for b in range(a + 1, ncols)
+    ]
+
+    for _ in range(extra_count):
+        r = rng.randrange(nrows)
+        a, b = rng.sample(range(ncols), 2)
+        others = [solution[r2][b] for r2 in range(nrows) if r2 != r]
+
+        if rng.random() < 0.5:
+            # not equal to one other member
+            targets = frozenset(range(nrows)) - {rng.choice(others)}
+        else:
+            # one of the true member and one or two others
+            decoys = rng.sample(others, min(len(others), rng.randint(1, 2)))
+            targets = frozenset([solution[r][b]] + decoys)
+
+        clues.append( (a, solution[r][a], b, targets) )
+
+    return clues
+
+
+def to_rule(clue):
+    icol_match, imember, icol_target, targets = clue
+    target_mask = sum(1 << t for t in targets)
+    return (icol_match, 1 << imember, icol_target, target_mask)
+
+
+# Remove clues (in random order) while the solution stays unique. Returns the
+# kept clues. Raises ValueError if the clues don't start out unique.
+
+def minimize_clues(nrows, ncols, clues, rng):
+    solver = GridSolver(nrows, ncols)
+
+    order = list(clues)
+    rng.shuffle(order)
+    rules = [to_rule(c) for c in order]
+    n = len(order)
+
+    # suffix_states[i] is propagated with rules[i:]
+
+    suffix_states = [None] * (n + 1)
+
+    state = solver.start_state()
+    solver.propagate(state, [])
+    suffix_states[n] = state
+
+    for i in range(n - 1, -1, -1):
+        state = state.copy()
+        solver.propagate(state, rules[i:])
+        suffix_states[i] = state
+
+    if 1 != solver.count_solutions(suffix_states[0].copy(), rules):
+        raise ValueError("Clue pool does not have a unique solution")
+
+    kept = []
+    kept_rules = []
+    kept_state = solver.start_state()
+
+    for i in range(n):
+        active_rules = kept_rules + rules[i+1:]
+        trial = [a & b for a, b in zip(kept_state, suffix_states[i+1])]
+
+        if 1 != solver.count_solutions(trial, active_rules):
+            kept.append(order[i])
+            kept_rules.append(rules[i])
+            solver.propagate(kept_state, kept_rules)
+
+    return kept
+
+
+# Puzzle text in the LogicGridPuzzle.py format. Categories are named A, B,
+# ... and their members A0, A1, ...
+
+def category_name(icol):
+    name = ''
+    icol += 1
+    while icol:
+        icol, rem = divmod(icol - 1, 26)
+        name = chr(ord('A') + rem) + name
+    return name
+
+
+def member_name(icol, imember):
+    return f"{category_name(icol)}{imember}"
+
+
+def format_puzzle(nrows, ncols, clues, comment=None):
+    lines = []
+
+    if comment:
+        lines += [f"# {comment}", '']
+
+    for icol in range(ncols):
+        members = ' '.join(member_name(icol, i) for i in range(nrows))
+        lines.append(f"{category_name(icol)}: {members}")
+
+    lines.append('')
+
+    for icol_match, imember, icol_target, targets in clues:
+        match = member_name(icol_match, imember)
+        excluded = sorted(set(range(nrows)) - targets)
+
+        if 1 == len(targets):
+            clue_op, members = '=', targets
+        elif 0 < len(excluded) < len(targets):
+            clue_op, members = '!=', excluded
+        else:
+            clue_op, members = 'in', sorted(targets)
+
+        target_names = ' '.join(member_name(icol_target, t) for t in members)
+        lines.append(f"{match} {clue_op} {target_names}")
+
+    return '\n'.join(lines) + '\n'
+
+
+# Generate one puzzle, returning (puzzle text, solution). The solution uses
+# member names, solution[row][col].
+
+def generate_puzzle(nrows, ncols, rng, extra_count=None, minimize=True):
+    if extra_count is None:
+        extra_count = nrows * ncols
+
+    solution = random_solution(nrows, ncols, rng)
+    clues = clue_pool(solution, rng, extra_count)
+
+    if minimize:
+        clues = minimize_clues(nrows, ncols, clues, rng)
+    else:
+        rng.shuffle(clues)
+
+    text = format_puzzle(
+        nrows,
+        ncols,
+        clues,
+        f"Generated {nrows}x{ncols} puzzle, {len(clues)} clues"
+    )
+
+    named_solution = [
+        [member_name(icol, imember) for icol, imember in enumerate(row)]
+        for row in solution
+    ]
+
+    return text, named_solution
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Generate logic grid puzzles with a unique solution.'
+    )
+    parser.add_argument('--rows', type=int, default=7,
+        help='members per category')
+    parser.add_argument('--cols', type=int, default=4,
+        help='number of categories')
+    parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--extra', type=int, default=None,
+        help='random not equal / one of clues added to the pool '
+            '(default: rows * cols)')
+    parser.add_argument('--ndjson', action='store_true',
+        help='write {"id", "puzzle", "solution"} lines (BatchSolve.py input)')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+
+    for ipuzzle in range(args.count):
+        text, solution = generate_puzzle(args.rows, args.cols, rng, args.extra)
+
+        if args.ndjson:
+            print(json.dumps({'id': ipuzzle, 'puzzle': text, 'solution': solution}))
+        else:
+            if ipuzzle:
+                print()
+            sys.stdout.write(text)
+
+
+if __name__ == '__main__':
+    main()
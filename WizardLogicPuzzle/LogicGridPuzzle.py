@@ -0,0 +1,383 @@
+# Generalized N x M logic grid puzzle model, loaded from a data file.
+#
+# The wizard solvers hard-code their categories, members and clues. This module
+# loads the same kind of puzzle (any number of categories, each with the same
+# number of members) from a compact text format, and builds the grid state and
+# compiled rules used by SolveWizardsPuzzlePure.py at runtime.
+#
+# Puzzle file format (see wizards.puzzle):
+#
+#   # comment (blank lines are ignored too)
+#   Realm: Avalon Bryndor Celestia Dorne Eldoria Faeland Galoria
+#   Artifact: Amulet Crystal Mirror Orb Ring Staff Tome
+#
+#   Celestia = Crystal              equal
+#   Celestia != Amulet Tome         not equal (to any of the listed members)
+#   Amulet in Avalon Bryndor        one of
+#
+# Lines containing ':' declare a category followed by its members. The first
+# category is the row key (its members are pinned, one per row). Clues refer to
+# members by name, or as Category.Member where a name is ambiguous. All
+# members on the right side of a clue must belong to one category, and it must
+# differ from the category of the left side.
+#
+# Each clue compiles to one rule in the same form as raw_rules in
+# SolveWizardsPuzzlePure.py, (match member, set of target members), so 'not
+# equal' is encoded as the remaining members of the target category.
+#
+# Compiled puzzles are cached on disk, keyed by a hash of the file content, so
+# repeated loads skip parsing entirely.
+
+import os
+import sys
+import json
+import hashlib
+import typing
+from enum import Enum
+
+# bump when the compiled form changes, so stale cache files are ignored
+
+COMPILED_FORMAT_VERSION = 3
+
+default_cache_dir = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'logic-grid-puzzles'
+)
+
+
+# The compiled form is plain data (stored as JSON in the disk cache):
+#
+#   categories: ((category_name, (member_name, ...)), ...)
+#   rule_data:  ((rule_num, (icol, imember), (icol, frozenset(imember, ...))), ...)
+
+class CompiledPuzzle(typing.NamedTuple):
+    categories: tuple
+    rule_data: tuple
+
+
+clue_operators = ('!=', '=', 'in')
+
+
+def split_clue(line):
+    for clue_op in clue_operators:
+        if clue_op == 'in':
+            parts = line.split(None, 2)
+            if len(parts) == 3 and parts[1] == 'in':
+                return parts[0], clue_op, parts[2]
+        elif clue_op in line:
+            left, right = line.split(clue_op, 1)
+            return left.strip(), clue_op, right.strip()
+
+    raise ValueError(f"Unrecognized clue: {line!r}")
+
+
+# Parse puzzle text into the compiled form. Raises ValueError (with the line
+# number) for malformed input.
+
+def parse_puzzle(text):
+    categories = []
+    clue_lines = []
+
+    for iline, line in enumerate(text.splitlines(), 1):
+        line = line.split('#', 1)[0].strip()
+
+        if not line:
+            continue
+
+        if ':' in line:
+            if clue_lines:
+                raise ValueError(f"Line {iline}: categories must precede clues")
+
+            name, members = line.split(':', 1)
+            name = name.strip()
+            members = tuple(members.split())
+
+            # names become enum members in upper case (see LogicGridPuzzle),
+            # so they must be distinct ignoring case
+
+            if name.upper() in {n.upper() for n, m in categories}:
+                raise ValueError(f"Line {iline}: duplicate category {name!r}")
+
+            if len({m.upper() for m in members}) != len(members):
+                raise ValueError(
+                    f"Line {iline}: category {name} has duplicate members "
+                    f"(names are compared ignoring case)"
+                )
+
+            categories.append( (name, members) )
+        else:
+            clue_lines.append( (iline, line) )
+
+    if len(categories) < 2:
+        raise ValueError("A puzzle needs at least two categories")
+
+    member_count = len(categories[0][1])
+
+    for name, members in categories:
+        if len(members) != member_count or len(set(members)) != member_count:
+            raise ValueError(
+                f"Category {name} must have {member_count} distinct members"
+            )
+
+    # resolve member references to (icol, imember)
+
+    member_lookup = {}
+
+    for icol, (name, members) in enumerate(categories):
+        for imember, member in enumerate(members):
+            member_lookup.setdefault(member, []).append( (icol, imember) )
+            member_lookup[f"{name}.{member}"] = [ (icol, imember) ]
+
+    def resolve(iline, ref):
+        found = member_lookup.get(ref, [])
+        if len(found) != 1:
+            problem = 'Ambiguous' if found else 'Unknown'
+            raise ValueError(f"Line {iline}: {problem} member {ref!r}")
+        return found[0]
+
+    rule_data = []
+
+    for iline, line in clue_lines:
+        left, clue_op, right = split_clue(line)
+
+        icol_match, imember_match = resolve(iline, left)
+
+        targets = [resolve(iline, ref) for ref in right.split()]
+        target_cols = {icol for icol, imember in targets}
+
+        if len(target_cols) != 1:
+            raise ValueError(f"Line {iline}: targets must be in one category")
+
+        icol_target = target_cols.pop()
+
+        if icol_target == icol_match:
+            raise ValueError(f"Line {iline}: target category matches left side")
+
+        if clue_op == '=' and len(targets) != 1:
+            raise ValueError(f"Line {iline}: '=' takes a single member")
+
+        target_members = frozenset(imember for icol, imember in targets)
+
+        if clue_op == '!=':
+            target_members = frozenset(range(member_count)) - target_members
+
+        if not target_members:
+            raise ValueError(f"Line {iline}: clue excludes every member")
+
+        # Number the rules starting at 1, rule numbers are negated to
+        # indicate commutation (and -0 would be ambiguous).
+
+        rule_data.append( (
+            len(rule_data) + 1,
+            (icol_match, imember_match),
+            (icol_target, target_members)
+        ) )
+
+    compiled = CompiledPuzzle(tuple(categories), tuple(rule_data))
+
+    return compiled
+
+
+# JSON form of a compiled puzzle, lists in place of tuples and frozensets.
+
+def compiled_to_json(compiled):
+    return json.dumps( {
+        'categories': [[name, list(members)] for name, members in compiled.categories],
+        'rule_data': [
+            [rule_num, list(match), [icol_target, sorted(targets)]]
+            for rule_num, match, (icol_target, targets) in compiled.rule_data
+        ],
+    } )
+
+
+# Rebuild a compiled puzzle from its JSON form. Cache files are only data, but
+# may be stale, truncated or written by something else, so the shape is checked
+# and anything unexpected raises ValueError.
+
+def compiled_from_json(data):
+    data = json.loads(data)
+
+    categories = tuple(
+        (name, tuple(members)) for name, members in data['categories']
+    )
+
+    ncols = len(categories)
+    nrows = len(categories[0][1]) if categories else 0
+
+    if ncols < 2 or not all(
+        isinstance(name, str)
+        and len(members) == nrows
+        and all(isinstance(m, str) for m in members)
+        for name, members in categories
+    ):
+        raise ValueError("Bad compiled categories")
+
+    def check_index(value, limit):
+        if type(value) is not int or not (0 <= value < limit):
+            raise ValueError("Bad compiled rule")
+        return value
+
+    rule_data = []
+
+    for rule_num, (icol_match, imember_match), (icol_target, targets) in data['rule_data']:
+        if type(rule_num) is not int or not targets:
+            raise ValueError("Bad compiled rule")
+
+        rule_data.append( (
+            rule_num,
+            (check_index(icol_match, ncols), check_index(imember_match, nrows)),
+            (
+                check_index(icol_target, ncols),
+                frozenset(check_index(t, nrows) for t in targets)
+            )
+        ) )
+
+    compiled = CompiledPuzzle(categories, tuple(rule_data))
+
+    return compiled
+
+
+def content_hash(text):
+    digest = hashlib.sha256(
+        f"{COMPILED_FORMAT_VERSION}\n{text}".encode('utf-8')
+    ).hexdigest()
+    return digest
+
+
+# Compile puzzle text, using the in-process and on-disk caches. Pass
+# cache_dir=None to disable the disk cache. The in-process cache is simply
+# cleared when it grows past its limit.
+
+compiled_cache: dict[str, CompiledPuzzle] = {}
+compiled_cache_limit: int = 4096
+
+def compile_puzzle(text, cache_dir=default_cache_dir):
+    digest = content_hash(text)
+
+    compiled = compiled_cache.get(digest)
+
+    if compiled is not None:
+        return compiled
+
+    cache_path = None
+
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, digest + '.json')
+
+        # any read, decode or shape error is just a cache miss
+
+        try:
+            with open(cache_path, encoding='utf-8') as f:
+                compiled = compiled_from_json(f.read())
+        except Exception:
+            compiled = None
+
+    if compiled is None:
+        compiled = parse_puzzle(text)
+
+        if cache_path is not None:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+
+                # write then rename, so concurrent loaders never see a
+                # partial file
+
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(compiled_to_json(compiled))
+                os.replace(tmp_path, cache_path)
+            except OSError:
+                pass
+
+    if len(compiled_cache) >= compiled_cache_limit:
+        compiled_cache.clear()
+
+    compiled_cache[digest] = compiled
+
+    return compiled
+
+
+# A puzzle instance built from the compiled form. Categories become enums (one
+# per category, member values are indices) so the pure solver functions work
+# unchanged. Each category enum records its state column.
+
+class LogicGridPuzzle:
+    def __init__(self, compiled, name=None):
+        self.name = name
+        self.compiled = compiled
+        self.categories = compiled.categories
+        self.rule_data = compiled.rule_data
+
+        self.Catagory = Enum(
+            'Catagory',
+            [cat_name.upper() for cat_name, members in self.categories],
+            start=0
+        )
+
+        self.category_enums = tuple(
+            Enum(cat_name, [m.upper() for m in members], start=0)
+            for cat_name, members in self.categories
+        )
+
+        for icol, category_enum in enumerate(self.category_enums):
+            category_enum.column = icol
+
+        # rules in the pure solver form: rule_num, rule_match, rule_target
+
+        self.rules = tuple(
+            (
+                rule_num,
+                self.get_member(icol_match, imember_match),
+                frozenset(
+                    self.get_member(icol_target, i) for i in target_members
+                )
+            )
+            for rule_num, (icol_match, imember_match),
+                (icol_target, target_members) in self.rule_data
+        )
+
+    @property
+    def dim(self):
+        return len(self.categories[0][1]), len(self.categories)
+
+    def get_member(self, icol, imember):
+        return self.category_enums[icol](imember)
+
+    def get_member_name(self, icol, imember):
+        return self.categories[icol][1][imember]
+
+    # grid state: one row per member of the first category, each cell the set
+    # of members remaining
+
+    def start_state(self):
+        row_enum, *other_enums = self.category_enums
+
+        state = [
+            [ {r} ] + [ set(e) for e in other_enums ]
+            for r in row_enum
+        ]
+        return state
+
+
+def load_puzzle_text(text, name=None, cache_dir=default_cache_dir):
+    compiled = compile_puzzle(text, cache_dir)
+    puzzle = LogicGridPuzzle(compiled, name)
+    return puzzle
+
+
+def load_puzzle(path, cache_dir=default_cache_dir):
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+
+    puzzle = load_puzzle_text(text, os.path.basename(path), cache_dir)
+    return puzzle
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        puzzle = load_puzzle(path)
+        rows, cols = puzzle.dim
+        print(f"{path}: {rows}x{cols}, {len(puzzle.rules)} rules")
+        for rule_num, rule_match, rule_target in puzzle.rules:
+            target_names = ' '.join(sorted(m.name for m in rule_target))
+            print(f"  {rule_num}. {rule_match.name}: {target_names}")
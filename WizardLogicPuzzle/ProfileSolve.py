@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+# Profile the pure solver (SolveWizardsPuzzlePure.py) on a puzzle, to see which
+# clues do the work when a search is slow.
+#
+# The solver calls profiler hooks when SolveWizardsPuzzlePure.profiler is set
+# (it's None by default, so normal solves pay one test per hook). A
+# SolverProfiler records:
+#
+#   rules      per rule number, including the negative numbers used for the
+#              commuted form of single target rules (see apply_rule): calls,
+#              calls that changed the state, members pruned, time (including
+#              the single elimination it triggers), and contradictions raised
+#              while it was running
+#
+#   singles    eliminate_singles calls, sweeps (passes over the column) and
+#              members eliminated
+#
+#   depths     search tree shape, per depth: nodes, how each node ended
+#              (transposition table hit, dead end, branch, leaf), branches
+#              pruned before recursing, and solutions found
+#
+# Results can be written as JSON, and as collapsed stacks (one
+# "frame;frame;frame count" line per stack, count in microseconds of self
+# time) for flamegraph.pl, speedscope and similar tools. Stacks nest the search
+# depths, so the flame graph shows where in the tree the time goes:
+#
+#   depth 0;depth 1;rule -7;eliminate_singles 1520
+
+import sys
+import json
+import time
+import argparse
+
+import SolveWizardsPuzzlePure
+import LogicGridPuzzle
+
+
+node_kinds = ('table_hit', 'dead_end', 'branch', 'leaf')
+
+
+class SolverProfiler:
+    def __init__(self):
+        # open frames: [stack path, start time, child seconds, rule_num or None]
+        self.stack = []
+        self.collapsed = {}
+
+        self.rule_stats = {}
+        self.singles = {'calls': 0, 'sweeps': 0, 'eliminations': 0, 'seconds': 0.0}
+        self.depth_stats = []
+        self.depth = 0
+
+    def enter(self, name, rule_num=None):
+        if self.stack:
+            path = self.stack[-1][0] + ';' + name
+        else:
+            path = name
+
+        self.stack.append([path, time.perf_counter(), 0.0, rule_num])
+
+    def exit(self):
+        path, start_time, child_seconds, rule_num = self.stack.pop()
+        seconds = time.perf_counter() - start_time
+
+        self.collapsed[path] = self.collapsed.get(path, 0.0) + seconds - child_seconds
+
+        if self.stack:
+            self.stack[-1][2] += seconds
+
+        return seconds
+
+    # A StateContradiction skips the exit hooks of the frames it passes
+    # through. The solver takes a mark when a search node starts and unwinds
+    # to it when it catches one. The innermost rule unwound raised it.
+
+    def mark(self):
+        return len(self.stack)
+
+    def unwind(self, mark):
+        raised = True
+
+        while len(self.stack) > mark:
+            rule_num = self.stack[-1][3]
+            seconds = self.exit()
+
+            if rule_num == 'singles':
+                self.singles['seconds'] += seconds
+            elif rule_num is not None:
+                stats = self.rule_stats[rule_num]
+                stats['seconds'] += seconds
+
+                if raised:
+                    stats['contradictions'] += 1
+                    raised = False
+
+    # search_state hooks
+
+    def node_enter(self):
+        if len(self.depth_stats) <= self.depth:
+            self.depth_stats.append( dict(
+                {'nodes': 0, 'branches_pruned': 0, 'solutions': 0},
+                **{kind: 0 for kind in node_kinds}
+            ) )
+
+        self.depth_stats[self.depth]['nodes'] += 1
+        self.enter(f"depth {self.depth}")
+        self.depth += 1
+
+    def node_exit(self, kind, solution_count):
+        self.depth -= 1
+        stats = self.depth_stats[self.depth]
+        stats[kind] += 1
+
+        if kind == 'leaf':
+            stats['solutions'] += solution_count
+
+        self.exit()
+
+    def branch_pruned(self):
+        self.depth_stats[self.depth - 1]['branches_pruned'] += 1
+
+    # apply_rule_base hooks
+
+    def rule_enter(self, rule_num):
+        if rule_num not in self.rule_stats:
+            self.rule_stats[rule_num] = {
+                'calls': 0,
+                'changed': 0,
+                'pruned': 0,
+                'contradictions': 0,
+                'seconds': 0.0,
+            }
+
+        self.rule_stats[rule_num]['calls'] += 1
+        self.enter(f"rule {rule_num}", rule_num)
+
+    def rule_exit(self, rule_match_count, prune_count):
+        stats = self.rule_stats[self.stack[-1][3]]
+        stats['seconds'] += self.exit()
+
+        if rule_match_count:
+            stats['changed'] += 1
+            stats['pruned'] += prune_count
+
+    # eliminate_singles hooks
+
+    def singles_enter(self):
+        self.singles['calls'] += 1
+        self.enter('eliminate_singles', 'singles')
+
+    def singles_exit(self, sweep_count, elim_count):
+        self.singles['seconds'] += self.exit()
+        self.singles['sweeps'] += sweep_count
+        self.singles['eliminations'] += elim_count
+
+    # results
+
+    def summary(self):
+        def rounded(stats):
+            return {k: round(v, 6) if isinstance(v, float) else v for k, v in stats.items()}
+
+        total_seconds = sum(self.collapsed.values())
+
+        return {
+            'total_seconds': round(total_seconds, 6),
+            'rules': {
+                str(rule_num): rounded(stats)
+                for rule_num, stats in sorted(
+                    self.rule_stats.items(),
+                    key=lambda item: (abs(item[0]), item[0] < 0)
+                )
+            },
+            'singles': rounded(self.singles),
+            'depths': [dict(stats, depth=d) for d, stats in enumerate(self.depth_stats)],
+        }
+
+    def write_json(self, out_file):
+        json.dump(self.summary(), out_file, indent=2)
+        out_file.write('\n')
+
+    def write_collapsed(self, out_file):
+        for path, seconds in sorted(self.collapsed.items()):
+            count = round(seconds * 1_000_000)
+            if count:
+                out_file.write(f"{path} {count}\n")
+
+    def print(self, rule_names=None, out_file=sys.stdout):
+        summary = self.summary()
+
+        out_file.write(
+            f"{'rule':>6} {'calls':>8} {'changed':>8} {'pruned':>8} "
+            f"{'contra':>7} {'ms':>10}\n"
+        )
+
+        by_time = sorted(
+            summary['rules'].items(),
+            key=lambda item: item[1]['seconds'],
+            reverse=True
+        )
+
+        for rule_num, stats in by_time:
+            out_file.write(
+                f"{rule_num:>6} {stats['calls']:8} {stats['changed']:8} "
+                f"{stats['pruned']:8} {stats['contradictions']:7} "
+                f"{stats['seconds']*1000:10.3f}"
+            )
+            if rule_names:
+                out_file.write(f"  {rule_names.get(abs(int(rule_num)), '')}")
+            out_file.write('\n')
+
+        singles = summary['singles']
+        out_file.write(
+            f"\neliminate_singles: {singles['calls']} calls, "
+            f"{singles['sweeps']} sweeps, {singles['eliminations']} eliminated, "
+            f"{singles['seconds']*1000:.3f} ms\n\n"
+        )
+
+        out_file.write(
+            f"{'depth':>5} {'nodes':>7} {'tt_hit':>7} {'dead':>7} {'branch':>7} "
+            f"{'leaf':>7} {'pruned':>7} {'sols':>7}\n"
+        )
+
+        for stats in summary['depths']:
+            out_file.write(
+                f"{stats['depth']:5} {stats['nodes']:7} {stats['table_hit']:7} "
+                f"{stats['dead_end']:7} {stats['branch']:7} {stats['leaf']:7} "
+                f"{stats['branches_pruned']:7} {stats['solutions']:7}\n"
+            )
+
+        out_file.write(f"\ntotal {summary['total_seconds']*1000:.3f} ms\n")
+
+
+# Solve with a profiler installed, returning (solutions, profiler). No
+# transposition table is used unless one is passed (see solve).
+
+def profile(start_state, rules, table=None):
+    pure = SolveWizardsPuzzlePure
+    profiler = SolverProfiler()
+
+    old_profiler = pure.profiler
+    pure.profiler = profiler
+
+    try:
+        solution_list = pure.solve(start_state, rules, table)
+    finally:
+        pure.profiler = old_profiler
+
+    return solution_list, profiler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Profile the pure solver, per rule and per search depth.'
+    )
+    parser.add_argument('puzzle', nargs='?',
+        help='puzzle file (default: the built in wizards puzzle)')
+    parser.add_argument('--json', metavar='FILE',
+        help='write the profile as JSON')
+    parser.add_argument('--collapsed', metavar='FILE',
+        help='write collapsed stacks (flame graph input)')
+    parser.add_argument('--trace', action='store_true',
+        help='keep the solver trace output (slow, skews timing)')
+    args = parser.parse_args(argv)
+
+    SolveWizardsPuzzlePure.trace = args.trace
+
+    if args.puzzle:
+        puzzle = LogicGridPuzzle.load_puzzle(args.puzzle)
+        start_state, rules = puzzle.start_state(), puzzle.rules
+    else:
+        start_state, rules = SolveWizardsPuzzlePure.start_state, SolveWizardsPuzzlePure.rules
+
+    rule_names = {
+        rule_num: f"{rule_match.name}: "
+            f"{SolveWizardsPuzzlePure.get_set_str(rule_target, 'auto')}"
+        for rule_num, rule_match, rule_target in rules
+    }
+
+    solution_list, profiler = profile(start_state, rules)
+
+    print(f"{len(solution_list)} solutions\n")
+    profiler.print(rule_names)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            profiler.write_json(f)
+
+    if args.collapsed:
+        with open(args.collapsed, 'w') as f:
+            profiler.write_collapsed(f)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,21 @@
-from constraint import Problem, AllDifferentConstraint
-from itertools import groupby
+from constraint import (
+    Problem,
+    AllDifferentConstraint,
+    AllEqualConstraint,
+    InSetConstraint,
+    NotInSetConstraint,
+    BacktrackingSolver,
+    RecursiveBacktrackingSolver,
+    MinConflictsSolver,
+    Constraint,
+    FunctionConstraint,
+)
 import operator as op
 from functools import partial
-
-problem = Problem()
+import sys
+import csv
+import json
+import time
 
 # define all (cell) values, grouped by attributes (columns)
 
@@ -12,127 +24,468 @@ artifact = 'Amulet', 'Crystal', 'Mirror', 'Orb', 'Ring', 'Staff', 'Tome'
 field = 'Alchemy', 'Divination', 'Elemental', 'Enchantment', 'Healing', 'Illusion', 'Necromancy'
 familiar = 'Chimera', 'Dragon', 'Griffin', 'Pegasus', 'Phoenix', 'Salamander', 'Unicorn'
 
-# Our approach makes each value (cell name) a constraint variable. The solution
-# sets each variable to a valid realm. Here we use realm, but any of the
-# attributes would work as the, "primary key".
-
-all_vars = realm + artifact + field + familiar
-
-problem.addVariables(all_vars, realm)
-
-# attributes (columns) must contain unique values
-
-problem.addConstraint( AllDifferentConstraint(), realm )
-problem.addConstraint( AllDifferentConstraint(), artifact )
-problem.addConstraint( AllDifferentConstraint(), field )
-problem.addConstraint( AllDifferentConstraint(), familiar )
-
-# Pin the realm values (first column)
+categories = realm, artifact, field, familiar
 
-for r in realm:
-    problem.addConstraint( partial(op.eq, r), [r] )
+# Clues (rules), each one a constraint operator and the pair of values it
+# applies to. Break up each clue into simple constraints.
 
-# Create constraints for each clue (rule).
-# Break up each clue into simple constraints.
+clues = (
 
 # 1.  The wizard from Celestia studies Illusion magic and does not have the Amulet of Dreams.
-problem.addConstraint( op.eq, ('Celestia', 'Illusion') )
-problem.addConstraint( op.ne, ('Celestia', 'Amulet') )
+    ( op.eq, ('Celestia', 'Illusion') ),
+    ( op.ne, ('Celestia', 'Amulet') ),
 
 # 2.  Eldoria's wizard holds the Orb of Shadows and is not versed in Necromancy or Alchemy.
-problem.addConstraint( op.eq, ('Eldoria', 'Orb') )
-problem.addConstraint( op.ne, ('Eldoria', 'Alchemy') )
+    ( op.eq, ('Eldoria', 'Orb') ),
+    ( op.ne, ('Eldoria', 'Necromancy') ),
+    ( op.ne, ('Eldoria', 'Alchemy') ),
 
 # 3.  The wizard who owns the Crystal of Time has a Phoenix as a familiar and is not from Dorne or Galoria.
-problem.addConstraint( op.eq, ('Crystal', 'Phoenix') )
-problem.addConstraint( op.ne, ('Crystal', 'Dorne') )
-problem.addConstraint( op.ne, ('Crystal', 'Galoria') )
+    ( op.eq, ('Crystal', 'Phoenix') ),
+    ( op.ne, ('Crystal', 'Dorne') ),
+    ( op.ne, ('Crystal', 'Galoria') ),
 
 # 4.  The Enchantment wizard is from Avalon and does not possess the Staff of Elements.
-problem.addConstraint( op.eq, ('Enchantment', 'Avalon') )
-problem.addConstraint( op.ne, ('Enchantment', 'Staff') )
+    ( op.eq, ('Enchantment', 'Avalon') ),
+    ( op.ne, ('Enchantment', 'Staff') ),
 
 # 5.  The wizard with the Griffin studies Healing magic
-problem.addConstraint( op.eq, ('Griffin', 'Healing') )
+    ( op.eq, ('Griffin', 'Healing') ),
 
 # 6.  Faeland's wizard has the Ring of Realms but does not have a Salamander familiar.
-problem.addConstraint( op.eq, ('Faeland', 'Ring') )
-problem.addConstraint( op.ne, ('Faeland', 'Salamander') )
+    ( op.eq, ('Faeland', 'Ring') ),
+    ( op.ne, ('Faeland', 'Salamander') ),
 
 # 7.  The Necromancy wizard holds the Mirror of Truth and is not from Bryndor.
-problem.addConstraint( op.eq, ('Necromancy', 'Mirror') )
-problem.addConstraint( op.ne, ('Necromancy', 'Bryndor') )
+    ( op.eq, ('Necromancy', 'Mirror') ),
+    ( op.ne, ('Necromancy', 'Bryndor') ),
 
 # 8.  The wizard from Dorne has a Unicorn familiar and does not study Divination
-problem.addConstraint( op.eq, ('Dorne', 'Unicorn') )
-problem.addConstraint( op.ne, ('Dorne', 'Divination') )
+    ( op.eq, ('Dorne', 'Unicorn') ),
+    ( op.ne, ('Dorne', 'Divination') ),
 
 # 9.  The Alchemy wizard is from Galoria and does not possess the Tome of Secrets.
-problem.addConstraint( op.eq, ('Alchemy', 'Galoria') )
-problem.addConstraint( op.ne, ('Alchemy', 'Tome') )
+    ( op.eq, ('Alchemy', 'Galoria') ),
+    ( op.ne, ('Alchemy', 'Tome') ),
 
 # 10. The wizard who studies Divination has a Salamander familiar.
-problem.addConstraint( op.eq, ('Divination', 'Salamander') )
+    ( op.eq, ('Divination', 'Salamander') ),
 
 # 11. The Staff of Elements artifact is held by the wizard whose (familiar) is a Dragon.
-problem.addConstraint( op.eq, ('Staff', 'Dragon') )
+    ( op.eq, ('Staff', 'Dragon') ),
 
 # 12. The wizard from Bryndor does not study Healing magic.
-problem.addConstraint( op.ne, ('Bryndor', 'Healing') )
+    ( op.ne, ('Bryndor', 'Healing') ),
 
 # 13. The wizard with the Pegasus familiar studies Elemental Magic.
-problem.addConstraint( op.eq, ('Pegasus', 'Elemental') )
+    ( op.eq, ('Pegasus', 'Elemental') ),
 
 # 14. The Tome of Secrets is not held by the wizard from Avalon.
-problem.addConstraint( op.ne, ('Tome', 'Avalon') )
+    ( op.ne, ('Tome', 'Avalon') ),
 
 # 15. The wizard who owns the Amulet of Dreams is from Bryndor.
-problem.addConstraint( op.eq, ('Amulet', 'Bryndor') )
+    ( op.eq, ('Amulet', 'Bryndor') ),
+)
 
 
-solutions = problem.getSolutions()
+# Solver strategies, python-constraint solvers by name. The min conflicts
+# solver is a local search, it finds at most one solution (and may fail to
+# find any within its step limit).
 
+solver_strategies = {
+    'backtracking': partial(BacktrackingSolver, forwardcheck=True),
+    'backtracking-nofc': partial(BacktrackingSolver, forwardcheck=False),
+    'recursive': partial(RecursiveBacktrackingSolver, forwardcheck=True),
+    'recursive-nofc': partial(RecursiveBacktrackingSolver, forwardcheck=False),
+    'minconflicts': MinConflictsSolver,
+}
 
-# Store solutions with cells accessable as [solution_index][row_index][col_index]
-solution_tables = []
+default_strategy = 'backtracking'
 
-# extract solutions in table form
+# strategies that may not find every solution
+incomplete_strategies = frozenset(['minconflicts'])
 
-for solution in solutions:
 
-    # sort by realm index (row), column index
-    sorted_solution = sorted(
-        [
-            ( realm.index(r), all_vars.index(v)//len(realm), r, v )
-            for v, r in list(solution.items())
-        ]
+# Use the library's typed constraints for clues where they fit, rather than
+# generic function constraints. A clue on a pinned (first column) value fixes
+# or excludes a single value of the other variable, which the set constraints
+# apply as a domain reduction before the search starts.
+
+def typed_constraint(clue_op, clue_vars, pinned):
+    if clue_op in (op.eq, op.ne) and 2 == len(clue_vars):
+        a, b = clue_vars
+
+        if a in pinned and b not in pinned:
+            a, b = b, a
+
+        if b in pinned:
+            if clue_op is op.eq:
+                return InSetConstraint([b]), [a]
+            else:
+                return NotInSetConstraint([b]), [a]
+
+        if clue_op is op.eq:
+            return AllEqualConstraint(), clue_vars
+        else:
+            return AllDifferentConstraint(), clue_vars
+
+    return clue_op, clue_vars
+
+
+# Search statistics. python-constraint doesn't count its search, so when
+# stats are wanted each constraint checked during the search is wrapped to
+# count its checks, and the checks that reject an assignment. The set
+# constraints are left alone, they are applied (and removed) before the search
+# starts.
+
+def search_stats():
+    return {
+        'constraint_checks': 0,
+        'constraint_rejections': 0,
+    }
+
+
+class CountingConstraint(Constraint):
+    def __init__(self, constraint, stats):
+        self.constraint = constraint
+        self.stats = stats
+
+    def __call__(self, variables, domains, assignments, forwardcheck=False):
+        self.stats['constraint_checks'] += 1
+
+        okay = self.constraint(variables, domains, assignments, forwardcheck)
+
+        if not okay:
+            self.stats['constraint_rejections'] += 1
+
+        return okay
+
+
+def counted_constraint(constraint, stats):
+    if stats is None or isinstance(constraint, (InSetConstraint, NotInSetConstraint)):
+        return constraint
+
+    if not isinstance(constraint, Constraint):
+        constraint = FunctionConstraint(constraint)
+
+    return CountingConstraint(constraint, stats)
+
+
+# Our approach makes each value (cell name) a constraint variable. The solution
+# sets each variable to a valid realm. Here we use realm (the first category),
+# but any of the attributes would work as the, "primary key".
+
+def build_problem(categories, clues, strategy=default_strategy, stats=None):
+    problem = Problem( solver_strategies[strategy]() )
+
+    row_members = categories[0]
+
+    # Pin the realm values (first column), each one's domain is just itself
+
+    for r in row_members:
+        problem.addVariable(r, [r])
+
+    for members in categories[1:]:
+        problem.addVariables(members, row_members)
+
+    # attributes (columns) must contain unique values
+
+    for members in categories:
+        problem.addConstraint(
+            counted_constraint(AllDifferentConstraint(), stats),
+            members
+        )
+
+    # Create constraints for each clue (rule).
+
+    pinned = frozenset(row_members)
+
+    for clue_op, clue_vars in clues:
+        constraint, constraint_vars = typed_constraint(clue_op, clue_vars, pinned)
+        problem.addConstraint( counted_constraint(constraint, stats), constraint_vars )
+
+    return problem
+
+
+# Convert a puzzle loaded by LogicGridPuzzle.py to categories and clues. Each
+# compiled rule is (match, target members). A single target is an equality,
+# otherwise the rule excludes the remaining members of the target category.
+#
+# All values share one variable namespace, so member names that appear in
+# more than one category are qualified as Category.Member.
+
+def puzzle_model(puzzle):
+    name_counts = {}
+
+    for cat_name, members in puzzle.categories:
+        for m in members:
+            name_counts[m] = name_counts.get(m, 0) + 1
+
+    puzzle_categories = tuple(
+        tuple(
+            m if 1 == name_counts[m] else f"{cat_name}.{m}"
+            for m in members
+        )
+        for cat_name, members in puzzle.categories
     )
 
-    solution_group = [
-        list(g)
-        for k, g in groupby(sorted_solution, lambda s: s[0])
-    ]
+    puzzle_clues = []
+
+    for rule_num, (icol_match, imember_match), (icol_target, target_members) \
+            in puzzle.rule_data:
+        match_var = puzzle_categories[icol_match][imember_match]
+        target_vars = puzzle_categories[icol_target]
+
+        if 1 == len(target_members):
+            imember_target = next(iter(target_members))
+            puzzle_clues.append(
+                ( op.eq, (match_var, target_vars[imember_target]) )
+            )
+        else:
+            puzzle_clues += [
+                ( op.ne, (match_var, target_vars[i]) )
+                for i in range(len(target_vars))
+                if i not in target_members
+            ]
+
+    return puzzle_categories, tuple(puzzle_clues)
+
+
+# Extract solutions in table form, with cells accessable as
+# [solution_index][row_index][col_index]
+#
+# Each solution maps every variable to a row value. The row of a variable is
+# the index of its value in the first column and its column is the category
+# it belongs to, both looked up in maps built once per puzzle.
+
+def get_index_maps(categories):
+    row_index = {r: irow for irow, r in enumerate(categories[0])}
+
+    var_column = {
+        v: icol
+        for icol, members in enumerate(categories)
+        for v in members
+    }
+
+    return row_index, var_column
+
+
+def iter_solution_tables(categories, solutions):
+    row_index, var_column = get_index_maps(categories)
+    nrows = len(categories[0])
+    ncols = len(categories)
 
-    solution_table = [
-        [value for row, col, realm, value in g ]
-        for g in solution_group
-    ]
+    for solution in solutions:
+        solution_table = [[None] * ncols for _ in range(nrows)]
 
-    solution_tables += [solution_table]
+        for v, r in solution.items():
+            solution_table[row_index[r]][var_column[v]] = v
 
-# print solutions
+        yield solution_table
 
-solnum = 0
 
-for solution_table in solution_tables:
-    solnum += 1
+def get_solution_tables(categories, solutions):
+    solution_tables = list(iter_solution_tables(categories, solutions))
+    return solution_tables
 
-    print(f"Solution: {solnum}")
+
+# Only the (iterative) backtracking solver can produce solutions one at a
+# time, other strategies return them all at once.
+
+streaming_strategies = frozenset(['backtracking', 'backtracking-nofc'])
+
+
+def iter_solutions(problem, strategy=default_strategy):
+    if strategy == 'minconflicts':
+        solution = problem.getSolution()
+        if solution:
+            yield solution
+    elif strategy in streaming_strategies:
+        yield from problem.getSolutionIter()
+    else:
+        yield from problem.getSolutions()
+
+
+def get_solutions(problem, strategy=default_strategy):
+    solutions = list(iter_solutions(problem, strategy))
+    return solutions
+
+
+def solve(categories, clues, strategy=default_strategy, stats=None):
+    problem = build_problem(categories, clues, strategy, stats)
+    solutions = get_solutions(problem, strategy)
+    solution_tables = get_solution_tables(categories, solutions)
+    return solution_tables
+
+
+def solve_iter(categories, clues, strategy=default_strategy):
+    problem = build_problem(categories, clues, strategy)
+    solutions = iter_solutions(problem, strategy)
+    return iter_solution_tables(categories, solutions)
+
+
+# Streaming solution writers. Each solution is written (and flushed) as soon
+# as the solver produces it, nothing is kept once it's written. Returns the
+# number of solutions written.
+
+def write_text(solution_tables, out_file):
+    solnum = 0
+
+    for solution_table in solution_tables:
+        solnum += 1
+
+        out_file.write(f"Solution: {solnum}\n\n")
+
+        for solrow in solution_table:
+            formatted_row = ' '.join( [c.ljust(11) for c in solrow] )
+            out_file.write(formatted_row + '\n')
+
+        out_file.write('\n')
+        out_file.flush()
+
+    return solnum
+
+
+# CSV, one line per solution row: solution number, row number, then the
+# values
+
+def write_csv(solution_tables, out_file):
+    writer = csv.writer(out_file)
+    solnum = 0
+
+    for solution_table in solution_tables:
+        solnum += 1
+
+        for irow, solrow in enumerate(solution_table):
+            writer.writerow( [solnum, irow] + solrow )
+
+        out_file.flush()
+
+    return solnum
+
+
+def write_ndjson(solution_tables, out_file):
+    solnum = 0
+
+    for solution_table in solution_tables:
+        solnum += 1
+
+        out_file.write(json.dumps({'solution': solnum, 'rows': solution_table}) + '\n')
+        out_file.flush()
+
+    return solnum
+
+
+solution_writers = {
+    'text': write_text,
+    'csv': write_csv,
+    'ndjson': write_ndjson,
+}
+
+
+# Time each strategy on a puzzle (best of repeat runs, building the problem
+# included). Returns a list of (strategy, seconds, solution count, status).
+#
+# Status is 'complete' for a complete strategy, 'incomplete' for a local
+# search that found a solution (it stops at one), and 'failed' for one that
+# found none or, for a complete strategy, found fewer solutions than the
+# others. Complete strategies are ranked first, fastest first, then the rest.
+
+def benchmark(categories, clues, strategies=tuple(solver_strategies), repeat=3):
+    results = []
+
+    for strategy in strategies:
+        best = None
+
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            problem = build_problem(categories, clues, strategy)
+            solutions = get_solutions(problem, strategy)
+            seconds = time.perf_counter() - start_time
+
+            if best is None or seconds < best:
+                best = seconds
+
+        results.append( [strategy, best, len(solutions), 'complete'] )
+
+    solution_count = max(
+        (count for strategy, seconds, count, status in results
+            if strategy not in incomplete_strategies),
+        default=None
+    )
+
+    for result in results:
+        strategy, seconds, count, status = result
+
+        if strategy in incomplete_strategies:
+            result[3] = 'incomplete' if count else 'failed'
+        elif count != solution_count:
+            result[3] = 'failed'
+
+    results = [tuple(result) for result in results]
+    results.sort(key=lambda result: (result[3] != 'complete', result[1]))
+
+    return results
+
+
+def print_benchmark(results, title=''):
+    print(f"Benchmark: {title}")
     print()
 
-    for solrow in solution_table:
-        formatted_row = ' '.join( [c.ljust(11) for c in solrow] )
-        print(formatted_row)
+    for strategy, seconds, solution_count, status in results:
+        print(
+            f"{strategy.ljust(18)} {seconds*1000:10.3f} ms  "
+            f"{solution_count} solutions  {status}"
+        )
+
+    complete = [result for result in results if result[3] == 'complete']
+
+    if complete:
+        print()
+        print(f"Fastest complete strategy: {complete[0][0]}")
 
     print()
 
+
+# With no puzzle files, solve the wizards puzzle encoded above. Otherwise solve
+# each puzzle file given (see LogicGridPuzzle.py for the format).
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Solve logic grid puzzles with python-constraint.'
+    )
+    parser.add_argument('puzzle_files', nargs='*')
+    parser.add_argument('--solver', choices=list(solver_strategies),
+        default=default_strategy)
+    parser.add_argument('--format', choices=list(solution_writers),
+        default='text', help='solution output format')
+    parser.add_argument('--benchmark', action='store_true',
+        help='time every solver strategy instead of printing solutions')
+    parser.add_argument('--repeat', type=int, default=3,
+        help='benchmark runs per strategy (best is reported)')
+    args = parser.parse_args()
+
+    puzzles = [ ('wizards', categories, clues) ]
+
+    if args.puzzle_files:
+        import LogicGridPuzzle
+
+        puzzles = [
+            (path, *puzzle_model(LogicGridPuzzle.load_puzzle(path)))
+            for path in args.puzzle_files
+        ]
+
+    for name, puzzle_categories, puzzle_clues in puzzles:
+        if args.benchmark:
+            size = f"{len(puzzle_categories[0])}x{len(puzzle_categories)}"
+            print_benchmark(
+                benchmark(puzzle_categories, puzzle_clues, repeat=args.repeat),
+                f"{name} ({size}, {len(puzzle_clues)} clues)"
+            )
+        else:
+            solution_writers[args.format](
+                solve_iter(puzzle_categories, puzzle_clues, args.solver),
+                sys.stdout
+            )
@@ -9,6 +9,7 @@ import enum
 from enum import Enum
 import copy
 import pprint
+from collections import OrderedDict
 
 class Realm(Enum):
     AVALON = 0
@@ -80,11 +81,17 @@ def get_category(emember):
   return category
 
 
+# Each category enum records its state column. Puzzles loaded at runtime (see
+# LogicGridPuzzle.py) build their own category enums the same way.
+
+for c in Catagory:
+    catagory_enum_lookup[c.name].column = c.value
+
+
 # get state column index given enum member
 
 def get_column(emember):
-    cat = get_category(emember)
-    icol = cat.value
+    icol = emember.column
     return icol
 
 
@@ -152,10 +159,12 @@ def get_set_str(fromset, verbose=False):
 
         first_item = next(iter(fromset))
         classname = first_item.__class__.__name__
-        short_classname = abbr_lookup[classname.upper()]
+        short_classname = abbr_lookup.get(classname.upper(), classname[0])
         prefix = short_classname + ':'
 
-        element_names = [abbr_lookup[e] for e in element_names]
+        # members of loaded puzzles have no abbreviation, use the first letter
+
+        element_names = [abbr_lookup.get(e, e[0]) for e in element_names]
 
     set_str = prefix + separator.join( sorted(element_names) )
 
@@ -186,7 +195,7 @@ raw_rules = (
 #       "Eldoria's" (=realm) wizard is [AND] not versed in "Necromancy" or "Alchemy" (!=field)
 
     ( Realm.ELDORIA, {Artifact.ORB} ),
-    ( Realm.ELDORIA, all_fields.difference(frozenset([Field.ALCHEMY])) ),
+    ( Realm.ELDORIA, all_fields.difference(frozenset([Field.NECROMANCY, Field.ALCHEMY])) ),
 
 # 3.  The wizard who owns the Crystal of Time has a Phoenix as a familiar and is not from Dorne or Galoria.
 #       The wizard who owns the "Crystal of Time" (=artifact) has [AND] a "Phoenix" (=familiar)
@@ -226,7 +235,7 @@ raw_rules = (
 #       The wizard from "Dorne" (=realm) does [AND] not study "Divination" (!=field)
 
     ( Realm.DORNE, {Familiar.UNICORN} ),
-    ( Realm.DORNE, all_realms.difference(frozenset([Field.DIVINATION])) ),
+    ( Realm.DORNE, all_fields.difference(frozenset([Field.DIVINATION])) ),
 
 # 9.  The Alchemy wizard is from Galoria and does not possess the Tome of Secrets.
 #       The "Alchemy" (=field) wizard is [AND] from "Galoria" (=realm)
@@ -287,53 +296,34 @@ def print_rules(rules):
         print( f"{rule_num}. {rule_match.name}: {get_set_str(rule_target, 'auto')}" )
 
 
-# verify rules are followed, return list of broken rules
-
-def check_rules(cur_state, rules):
-    broken_rules = []
-
-    for rule in rules:
-        rule_num, rule_match, rule_target = rule
-        rule_match_set = {rule_match}
-
-        icol_match = get_column(rule_match)
-
-        first_target_emember = next(iter(rule_target))
-        icol_target = get_column(first_target_emember)
-
-        matched_rows = [
-            row
-            for row in cur_state
-            if not rule_match_set.isdisjoint(row[icol_match])
-        ]
-
-        candidate_target_rows = [
-            row
-            for row in matched_rows
-            if not rule_target.isdisjoint(row[icol_target])
-        ]
-
-        if (not candidate_target_rows):
-            broken_rules += [rule]
-            pprint.pprint(f"BROKEN RULE: {rule_num}. Match: {repr(rule_match)}, Target: {repr(rule_target)}")
-
-    return broken_rules
-
-
 # For a catagory (column), where a value is a single set, the item in that set
-# should be removed from other values (because items must be unique).
+# should be removed from other values (because items must be unique). Raises
+# StateContradiction if the same single is found in more than one row.
 
-def eliminate_singles(cur_state, icol):
+def eliminate_singles(cur_state, icol, tracker=None):
     elim_count = 0
     old_count = -1
+    sweep_count = 0
+
+    if profiler is not None:
+        profiler.singles_enter()
 
     # Each iteration may create new singles, so loop until no changes.
     while old_count < elim_count:
         old_count = elim_count
+        sweep_count += 1
         found_single = False
         for row in cur_state:
             if 1 == len(row[icol]):
-                for r in cur_state:
+                for irow, r in enumerate(cur_state):
+
+                    # the same single in two rows can't be part of a solution
+
+                    if r is not row and r[icol] == row[icol]:
+                        raise StateContradiction(
+                            f"Found {get_set_str(row[icol], True)} in multiple rows."
+                        )
+
                     if (
                         1 < len(r[icol])
                         and not r[icol].isdisjoint(row[icol])
@@ -341,50 +331,89 @@ def eliminate_singles(cur_state, icol):
                         elim_count += 1
                         r[icol].difference_update(row[icol])
 
+                        if tracker is not None:
+                            tracker.cell_changed(cur_state, irow, icol)
+
+    if profiler is not None:
+        profiler.singles_exit(sweep_count, elim_count)
+
     return elim_count
 
 
+# Raised when the state can't lead to a solution (the same member is the only
+# value left in more than one row). During search this just means the branch
+# being tried is a dead end.
+
+class StateContradiction(ValueError):
+    pass
+
+
+# Print each change made by a rule. Useful for debugging, but slow, and noisy
+# when the solver is used as a library.
+
+trace = True
+
+
+# Set to a SolverProfiler (see ProfileSolve.py) to record per rule cost, single
+# elimination and search tree shape. None (the default) records nothing.
+
+profiler = None
+
+
 # Implement the rule application. May be called multiple times for a single rule
 # because if the target set is a single value, the rule is valid forward and
 # backwards (due to commutation). When a rule is run commutated, negation is
 # used to pass the rule_num as a negative number.
 
-def apply_rule_base(cur_state, rule_num, rule_match, rule_target):
+def apply_rule_base(cur_state, rule_num, rule_match, rule_target, tracker=None):
     rule_match_count = 0
+    prune_count = 0
+
+    if profiler is not None:
+        profiler.rule_enter(rule_num)
+
     rule_match_set = {rule_match}
     icol_match = get_column(rule_match)
 
     first_target_emember = next(iter(rule_target))
     icol_target = get_column(first_target_emember)
 
-    state_matched_rows = [s for s in cur_state if s[icol_match] == rule_match_set]
+    state_matched_rows = [
+        (irow, s) for irow, s in enumerate(cur_state)
+        if s[icol_match] == rule_match_set
+    ]
 
     if state_matched_rows:
         if len(state_matched_rows) != 1:
-            raise ValueError(
+            raise StateContradiction(
                 f"While processing rule {rule_num}, found multiple matching state rows."
             )
 
         # we know we have a list of exactly 1 item, pull that out now
-        state_row = state_matched_rows[0]
+        irow, state_row = state_matched_rows[0]
 
         old_target_set = state_row[icol_target].copy()
         state_row[icol_target] = state_row[icol_target].intersection(rule_target)
 
         if old_target_set != state_row[icol_target]:
             rule_match_count += 1
+            prune_count += len(old_target_set) - len(state_row[icol_target])
+
+            if tracker is not None:
+                tracker.cell_changed(cur_state, irow, icol_target)
 
             # The first column is different, it starts out as a single set. We
             # use this as a row identifier.
 
-            rowid = repr(next(iter(state_row[0])))
-            target_str = get_set_str(state_row[icol_target], verbose=True)
-            print(f"Rule {rule_num} changed target state row {rowid}: {target_str}")
+            if trace:
+                rowid = repr(next(iter(state_row[0])))
+                target_str = get_set_str(state_row[icol_target], verbose=True)
+                print(f"Rule {rule_num} changed target state row {rowid}: {target_str}")
 
             # if new target set contains 1 object, remove that object from all
             # other rows
 
-            _ = eliminate_singles(cur_state, icol_target)
+            _ = eliminate_singles(cur_state, icol_target, tracker)
 
     # apply the contrapositive (if not rule_target then not rule_match)
 
@@ -393,42 +422,51 @@ def apply_rule_base(cur_state, rule_num, rule_match, rule_target):
     #   Then remove rule_match from state_row[icol_match]
 
     state_matched_rows = [
-        state_row for state_row in cur_state
+        (irow, state_row) for irow, state_row in enumerate(cur_state)
         if 1 < len(state_row[icol_match])
             and not rule_match_set.isdisjoint(state_row[icol_match])
             and rule_target.isdisjoint(state_row[icol_target])
     ]
 
-    for state_row in state_matched_rows:
+    for irow, state_row in state_matched_rows:
         rule_match_count += 1
+        prune_count += 1
 
         state_row[icol_match].difference_update( rule_match_set )
 
+        if tracker is not None:
+            tracker.cell_changed(cur_state, irow, icol_match)
+
         # The first column is different, it starts out with one value. We
         # use this as a row identifier.
 
-        rowid = repr(next(iter(state_row[0])))
-        match_str = get_set_str(state_row[icol_match], verbose=True)
-        print(f"Rule {rule_num} changed match state row {rowid}: {match_str}")
+        if trace:
+            rowid = repr(next(iter(state_row[0])))
+            match_str = get_set_str(state_row[icol_match], verbose=True)
+            print(f"Rule {rule_num} changed match state row {rowid}: {match_str}")
 
         # if new match state set contains 1 object, remove that object
         # (state_row[icol_match]) from all other rows
 
-        _ = eliminate_singles(cur_state, icol_match)
+        _ = eliminate_singles(cur_state, icol_match, tracker)
+
+    if profiler is not None:
+        profiler.rule_exit(rule_match_count, prune_count)
 
     return rule_match_count
 
 # Apply rule and (if applicable) it's commuted version. Uses apply_rule_base
 # for the actual work.
 
-def apply_rule(cur_state, rule):
+def apply_rule(cur_state, rule, tracker=None):
     rule_num, rule_match, rule_target = rule
 
     rule_match_count = apply_rule_base(
         cur_state,
         rule_num,
         rule_match,
-        rule_target
+        rule_target,
+        tracker
     )
 
 
@@ -440,18 +478,219 @@ def apply_rule(cur_state, rule):
             cur_state,
             -rule_num,
             next(iter(rule_target)),
-            {rule_match}
+            {rule_match},
+            tracker
         )
 
     return rule_match_count
 
 
+# Incremental rule verification. Instead of scanning the whole state for
+# broken rules at every full solution, the tracker keeps the status of every
+# rule up to date as cells change (see cell_changed):
+#
+#   candidates  rows that can still match the rule (rule_match possible in the
+#               match column and a rule_target member possible in the target
+#               column)
+#   satisfied   some row has exactly rule_match, and only rule_target members
+#               left in the target column. Cells only shrink, so once
+#               satisfied a rule stays satisfied (on this search branch).
+#   violated    no candidate rows left, raised as a StateContradiction as
+#               soon as it happens
+#
+# Otherwise the rule is pending. Each cell change only re-evaluates the rules
+# using that column, for that row. When every cell is a single, each rule is
+# either satisfied or violated, so accepting a solution is O(1).
+
+class RuleTracker:
+    def __init__(self, cur_state, rules):
+        self.rules = rules
+
+        self.rule_columns = [
+            (get_column(rule_match), get_column(next(iter(rule_target))))
+            for rule_num, rule_match, rule_target in rules
+        ]
+
+        # rules to re-evaluate when a cell in a column changes
+
+        self.watchers = [[] for _ in cur_state[0]]
+
+        for irule, (icol_match, icol_target) in enumerate(self.rule_columns):
+            self.watchers[icol_match].append(irule)
+            self.watchers[icol_target].append(irule)
+
+        self.candidates = [set() for _ in rules]
+        self.satisfied = [False] * len(rules)
+        self.violated = set()
+
+        for irule in range(len(rules)):
+            for irow in range(len(cur_state)):
+                self.update(cur_state, irule, irow)
+
+            if not self.candidates[irule]:
+                self.violated.add(irule)
+
+        if self.violated:
+            self.raise_violation()
+
+    def copy(self):
+        tracker = copy.copy(self)
+        tracker.candidates = [c.copy() for c in self.candidates]
+        tracker.satisfied = self.satisfied.copy()
+        tracker.violated = self.violated.copy()
+        return tracker
+
+    def update(self, cur_state, irule, irow):
+        rule_num, rule_match, rule_target = self.rules[irule]
+        icol_match, icol_target = self.rule_columns[irule]
+
+        row = cur_state[irow]
+
+        if (
+            rule_match in row[icol_match]
+            and not rule_target.isdisjoint(row[icol_target])
+        ):
+            self.candidates[irule].add(irow)
+
+            if 1 == len(row[icol_match]) and row[icol_target] <= rule_target:
+                self.satisfied[irule] = True
+        else:
+            self.candidates[irule].discard(irow)
+
+    def cell_changed(self, cur_state, irow, icol):
+        for irule in self.watchers[icol]:
+            self.update(cur_state, irule, irow)
+
+            if not self.candidates[irule]:
+                self.violated.add(irule)
+
+        if self.violated:
+            self.raise_violation()
+
+    def status(self, irule):
+        if irule in self.violated:
+            return 'violated'
+        elif self.satisfied[irule]:
+            return 'satisfied'
+        else:
+            return 'pending'
+
+    def raise_violation(self):
+        rule_nums = sorted(self.rules[irule][0] for irule in self.violated)
+        raise StateContradiction(f"Rules violated: {rule_nums}")
+
+
+# Transposition table of dead ends, for sharing between searches.
+#
+# Within one search a state is never reached twice: search_state always
+# branches on the first unsolved cell, and sibling branches give that cell
+# different members, so their subtrees can't share a state. Repeats only
+# happen between searches, e.g. the same puzzle (or puzzles with the same
+# rules and overlapping start states) solved again with the same table.
+#
+# Only dead ends (states with no solution) are stored, as keys without
+# values, so an entry costs one key. A state with solutions is always searched,
+# storing its solutions at every node costs far more than it saves.
+#
+# The state is encoded as a tuple of per cell bit masks (bit n is set when the
+# member with value n remains in the cell). The key says nothing about the
+# rules, so a table is bound to the rules it was created for, and search_state
+# refuses a table made for other rules (its dead ends would be wrong there).
+#
+# The table is bounded by entry count and by a memory budget counted in cells
+# (each key costs one unit per cell). When either limit is exceeded the least
+# recently used entries are evicted.
+
+def encode_state(cur_state):
+    state_key = tuple(
+        sum(1 << m.value for m in c)
+        for row in cur_state
+        for c in row
+    )
+    return state_key
+
+
+class TranspositionTable:
+    def __init__(self, rules, max_entries=100_000, max_cells=4_000_000):
+        self.rules = rules
+        self.max_entries = max_entries
+        self.max_cells = max_cells
+        self.entries = OrderedDict()
+        self.cell_count = 0
+        self.hits = 0
+        self.misses = 0
+
+    def is_dead_end(self, state_key):
+        if state_key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(state_key)
+            return True
+
+        self.misses += 1
+        return False
+
+    def store_dead_end(self, state_key):
+        if state_key in self.entries:
+            self.entries.move_to_end(state_key)
+            return
+
+        self.entries[state_key] = None
+        self.cell_count += len(state_key)
+
+        while (
+            len(self.entries) > self.max_entries
+            or self.cell_count > self.max_cells
+        ):
+            old_key, _ = self.entries.popitem(last=False)
+            self.cell_count -= len(old_key)
+
+
 # Search state by applying rules iterativly then trying remaining possibilities
 # recursively.
+#
+# If a transposition table is passed, dead ends are looked up before the rules
+# are applied and stored when found. The table must have been created for the
+# same rules, otherwise ValueError is raised.
+#
+# The rule tracker must match cur_state, one is created if not passed.
+#
+# If a stats dict is passed (see search_stats), the search tree counts are
+# added to it (and table_hits, when a table is used).
+
+def search_stats():
+    return {
+        'nodes': 0,
+        'dead_ends': 0,
+        'branches': 0,
+        'branches_pruned': 0,
+        'leaves': 0,
+    }
+
 
-def search_state(cur_state, istart=0):
+def search_state(cur_state, istart=0, table=None, rules=rules, tracker=None,
+        stats=None):
     solution_list = []
 
+    if table is not None and table.rules is not rules:
+        raise ValueError("Transposition table was created for different rules")
+
+    if stats is not None:
+        stats['nodes'] += 1
+
+    if profiler is not None:
+        profiler.node_enter()
+        profile_mark = profiler.mark()
+
+    if table is not None:
+        start_key = encode_state(cur_state)
+
+        if table.is_dead_end(start_key):
+            if stats is not None:
+                stats['table_hits'] = stats.get('table_hits', 0) + 1
+            if profiler is not None:
+                profiler.node_exit('table_hit', 0)
+            return solution_list
+
     dim0 = len(cur_state)
     imax = dim0 * len(cur_state[0])
 
@@ -461,11 +700,37 @@ def search_state(cur_state, istart=0):
     total_rule_match_count = 0
     old_count = -1
 
-    while (old_count < total_rule_match_count):
-        old_count = total_rule_match_count
-        for r in rules:
-            rule_match_count = apply_rule(cur_state, r)
-            total_rule_match_count += rule_match_count
+    try:
+        if tracker is None:
+            tracker = RuleTracker(cur_state, rules)
+
+        while (old_count < total_rule_match_count):
+            old_count = total_rule_match_count
+            for irule, r in enumerate(rules):
+
+                # a satisfied rule has nothing left to apply
+
+                if tracker.satisfied[irule]:
+                    continue
+
+                rule_match_count = apply_rule(cur_state, r, tracker)
+                total_rule_match_count += rule_match_count
+
+        # a rule (or eliminating singles) can empty a cell, that's a dead
+        # end too
+
+        if any(not c for row in cur_state for c in row):
+            raise StateContradiction("Found an empty cell.")
+
+    except StateContradiction:
+        if stats is not None:
+            stats['dead_ends'] += 1
+        if profiler is not None:
+            profiler.unwind(profile_mark)
+            profiler.node_exit('dead_end', 0)
+        if table is not None:
+            table.store_dead_end(start_key)
+        return solution_list
 
     # At this point the logic rules have been applied. We expect many
     # cells to be solved (contain a singleton set), but some unsolved
@@ -493,25 +758,43 @@ def search_state(cur_state, istart=0):
 
         for e in trial_set:
             trial_state = copy.deepcopy(cur_state)
-            trial_state[r][c] = { e }
-            eliminate_singles(trial_state, c)
-            solution = search_state(trial_state, icur+1)
+            trial_tracker = tracker.copy()
+
+            try:
+                trial_state[r][c] = { e }
+                trial_tracker.cell_changed(trial_state, r, c)
+                eliminate_singles(trial_state, c, trial_tracker)
+            except StateContradiction:
+                if stats is not None:
+                    stats['branches_pruned'] += 1
+                if profiler is not None:
+                    profiler.unwind(profile_mark)
+                    profiler.branch_pruned()
+                continue
+
+            solution = search_state(
+                trial_state, icur+1, table, rules, trial_tracker, stats
+            )
 
             solution_list += solution
     else:
-        # No multi set found. This is a full solution
+        # No multi set found. This is a full solution, the tracker has
+        # already verified every rule (a broken rule would have raised).
+
+        if not tracker.violated:
+            solution_list += [ copy.deepcopy(cur_state) ]
 
-        # There should be no broken rules, unless there's a bug. Better check.
+    if table is not None and not solution_list:
+        table.store_dead_end(start_key)
 
-        broken_rules = check_rules(cur_state, rules)
+    if stats is not None:
+        stats['branches' if found_nonsingle else 'leaves'] += 1
 
-        if broken_rules:
-            print()
-            pprint.pprint(broken_rules)
-            print()
-            print('--------------------------------------------------------------')
+    if profiler is not None:
+        if found_nonsingle:
+            profiler.node_exit('branch', len(solution_list))
         else:
-            solution_list += [ copy.deepcopy(cur_state) ]
+            profiler.node_exit('leaf', len(solution_list))
 
     return solution_list
 
@@ -521,15 +804,44 @@ start_state = [
     for r in Realm
 ]
 
-cur_state = copy.deepcopy(start_state)
-istart = 0
 
-solution_list = search_state(cur_state)
+# Solve a puzzle from its start state, returning the list of solutions. By
+# default no transposition table is used, pass one to share dead ends between
+# solves with the same rules. Pass a stats dict (see search_stats) to count
+# the search tree.
+
+def solve(start_state, rules=rules, transposition_table=None, stats=None):
+    cur_state = copy.deepcopy(start_state)
+
+    solution_list = search_state(
+        cur_state,
+        table=transposition_table,
+        rules=rules,
+        stats=stats
+    )
+
+    return solution_list
+
+
+# With no arguments, solve the wizards puzzle encoded above. Otherwise solve
+# each puzzle file given (see LogicGridPuzzle.py for the format).
 
-for solution in solution_list:
-    pprint.pprint( [
-        [get_set_str(c, 'auto').ljust(11) for c in r]
-        for r in solution
-    ] )
+if __name__ == '__main__':
+    puzzles = [ (start_state, rules) ]
+
+    if 1 < len(sys.argv):
+        import LogicGridPuzzle
+
+        puzzles = [
+            (puzzle.start_state(), puzzle.rules)
+            for puzzle in map(LogicGridPuzzle.load_puzzle, sys.argv[1:])
+        ]
 
+    for puzzle_start_state, puzzle_rules in puzzles:
+        solution_list = solve(puzzle_start_state, puzzle_rules)
 
+        for solution in solution_list:
+            pprint.pprint( [
+                [get_set_str(c, 'auto').ljust(11) for c in r]
+                for r in solution
+            ] )
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+
+# Solve Wizards Puzzle (or any puzzle loaded by LogicGridPuzzle.py) as boolean
+# satisfiability, with a built in CDCL SAT solver. No external solver needed.
+#
+# CNF encoding, one variable per (row, category, member) meaning "the row's
+# cell in this category is this member":
+#
+#   * exactly one member per cell (row, category)
+#   * each member in exactly one row, per category
+#   * the first category is pinned, row r holds member r (unit clauses)
+#   * each rule (match, targets) gives one clause per row:
+#       not match(row) or target_1(row) or target_2(row) ...
+#     (the commuted form of a rule needs nothing extra, it follows)
+#
+# The solver is a conflict driven clause learning (CDCL) solver with two
+# watched literals per clause, VSIDS decision heuristic (with phase saving),
+# first UIP clause learning with non-chronological backjumping, and Luby
+# restarts. All solutions are enumerated by adding a blocking clause after
+# each one.
+#
+# The CNF can also be exported in DIMACS format, for comparing against other
+# SAT solvers offline.
+
+import os
+import heapq
+import argparse
+
+import LogicGridPuzzle
+
+
+# CNF variables are numbered from 1, see var_index
+
+def var_index(nrows, ncols, row, col, member):
+    return 1 + (row * ncols + col) * nrows + member
+
+
+def encode_puzzle(nrows, ncols, rule_data):
+    num_vars = nrows * ncols * nrows
+    clauses = []
+
+    def exactly_one(lits):
+        clauses.append(list(lits))
+        clauses.extend(
+            [-lits[i], -lits[j]]
+            for i in range(len(lits))
+            for j in range(i + 1, len(lits))
+        )
+
+    for col in range(ncols):
+        for row in range(nrows):
+            exactly_one([var_index(nrows, ncols, row, col, m) for m in range(nrows)])
+
+        for member in range(nrows):
+            exactly_one([var_index(nrows, ncols, r, col, member) for r in range(nrows)])
+
+    for row in range(nrows):
+        clauses.append( [var_index(nrows, ncols, row, 0, row)] )
+
+    for rule_num, (icol_match, imember_match), (icol_target, target_members) \
+            in rule_data:
+        for row in range(nrows):
+            clauses.append(
+                [-var_index(nrows, ncols, row, icol_match, imember_match)]
+                + [
+                    var_index(nrows, ncols, row, icol_target, t)
+                    for t in sorted(target_members)
+                ]
+            )
+
+    return num_vars, clauses
+
+
+# Convert rules in the pure solver form (enum members) to rule_data (indices)
+
+def rule_data_from_rules(rules):
+    rule_data = tuple(
+        (
+            rule_num,
+            (rule_match.column, rule_match.value),
+            (
+                next(iter(rule_target)).column,
+                frozenset(m.value for m in rule_target)
+            )
+        )
+        for rule_num, rule_match, rule_target in rules
+    )
+    return rule_data
+
+
+def write_dimacs(num_vars, clauses, out_file, comments=()):
+    for comment in comments:
+        out_file.write(f"c {comment}\n")
+
+    out_file.write(f"p cnf {num_vars} {len(clauses)}\n")
+
+    for clause in clauses:
+        out_file.write(' '.join(map(str, clause)) + ' 0\n')
+
+
+# Luby restart sequence: 1 1 2 1 1 2 4 1 1 2 ...
+
+def luby(i):
+    size, seq = 1, 0
+    while size < i + 1:
+        seq += 1
+        size = 2 * size + 1
+
+    while size - 1 != i:
+        size = (size - 1) >> 1
+        seq -= 1
+        i %= size
+
+    return 1 << seq
+
+
+# Literals are non zero ints (DIMACS style), -v is the negation of v. Watch
+# lists are indexed by literal, watches[lit_index(p)] holds the clauses
+# watching -p, visited when p becomes true.
+
+def lit_index(lit):
+    return 2 * lit if lit > 0 else -2 * lit + 1
+
+
+class CdclSolver:
+    restart_base = 100
+    var_decay = 0.95
+
+    def __init__(self, num_vars):
+        self.num_vars = num_vars
+        self.clauses = []
+        self.watches = [[] for _ in range(2 * num_vars + 2)]
+
+        self.assigns = [0] * (num_vars + 1)     # 1 true, -1 false, 0 unassigned
+        self.level = [0] * (num_vars + 1)
+        self.reason = [None] * (num_vars + 1)   # clause index that implied it
+        self.trail = []
+        self.trail_lim = []
+        self.qhead = 0
+
+        self.activity = [0.0] * (num_vars + 1)
+        self.var_inc = 1.0
+        self.phase = [-1] * (num_vars + 1)
+        self.order_heap = [(0.0, v) for v in range(1, num_vars + 1)]
+
+        self.ok = True
+
+        self.stats = {
+            'decisions': 0,
+            'propagations': 0,
+            'conflicts': 0,
+            'learnt': 0,
+            'restarts': 0,
+        }
+
+    def value(self, lit):
+        a = self.assigns[abs(lit)]
+        return a if lit > 0 else -a
+
+    def decision_level(self):
+        return len(self.trail_lim)
+
+    # Add a clause (only at decision level 0). Returns False if the problem
+    # is now known to be unsatisfiable.
+
+    def add_clause(self, lits):
+        if not self.ok:
+            return False
+
+        self.cancel_until(0)
+
+        clause = []
+
+        for lit in lits:
+            v = self.value(lit)
+            if v == 1 or -lit in clause:
+                return True
+            if v == 0 and lit not in clause:
+                clause.append(lit)
+
+        if not clause:
+            self.ok = False
+        elif 1 == len(clause):
+            self.enqueue(clause[0], None)
+            self.ok = self.propagate() is None
+        else:
+            self.attach(clause)
+
+        return self.ok
+
+    def attach(self, clause):
+        ci = len(self.clauses)
+        self.clauses.append(clause)
+        self.watches[lit_index(-clause[0])].append(ci)
+        self.watches[lit_index(-clause[1])].append(ci)
+        return ci
+
+    def enqueue(self, lit, reason):
+        v = abs(lit)
+        self.assigns[v] = 1 if lit > 0 else -1
+        self.level[v] = self.decision_level()
+        self.reason[v] = reason
+        self.trail.append(lit)
+
+    # Unit propagation with two watched literals. Returns the index of a
+    # conflicting clause, or None.
+
+    def propagate(self):
+        clauses = self.clauses
+        watches = self.watches
+        assigns = self.assigns
+        trail = self.trail
+
+        while self.qhead < len(trail):
+            p = trail[self.qhead]
+            self.qhead += 1
+            self.stats['propagations'] += 1
+
+            false_lit = -p
+            ws = watches[lit_index(p)]
+            kept = []
+
+            for iw, ci in enumerate(ws):
+                c = clauses[ci]
+
+                # make sure the false literal is c[1]
+
+                if c[0] == false_lit:
+                    c[0], c[1] = c[1], c[0]
+
+                first = c[0]
+                a = assigns[abs(first)]
+                if (a if first > 0 else -a) == 1:
+                    kept.append(ci)
+                    continue
+
+                # look for a new literal to watch
+
+                for k in range(2, len(c)):
+                    lit = c[k]
+                    a = assigns[abs(lit)]
+                    if (a if lit > 0 else -a) != -1:
+                        c[1], c[k] = lit, c[1]
+                        watches[lit_index(-lit)].append(ci)
+                        break
+                else:
+                    kept.append(ci)
+
+                    a = assigns[abs(first)]
+                    if (a if first > 0 else -a) == -1:
+                        kept.extend(ws[iw+1:])
+                        watches[lit_index(p)] = kept
+                        return ci
+
+                    self.enqueue(first, ci)
+
+            watches[lit_index(p)] = kept
+
+        return None
+
+    def bump(self, v):
+        self.activity[v] += self.var_inc
+
+        if self.activity[v] > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.var_inc *= 1e-100
+            self.order_heap = [
+                (-self.activity[u], u)
+                for u in range(1, self.num_vars + 1)
+                if not self.assigns[u]
+            ]
+            heapq.heapify(self.order_heap)
+        elif not self.assigns[v]:
+            heapq.heappush(self.order_heap, (-self.activity[v], v))
+
+    # First UIP conflict analysis. Returns the learnt clause (asserting
+    # literal first, a literal of the backjump level second) and the level to
+    # backjump to.
+
+    def analyze(self, ci):
+        seen = set()
+        learnt = [None]
+        counter = 0
+        p = None
+        itrail = len(self.trail) - 1
+        cur_level = self.decision_level()
+
+        clause = self.clauses[ci]
+
+        while True:
+            for q in (clause if p is None else clause[1:]):
+                v = abs(q)
+                if v not in seen and self.level[v] > 0:
+                    seen.add(v)
+                    self.bump(v)
+                    if self.level[v] == cur_level:
+                        counter += 1
+                    else:
+                        learnt.append(q)
+
+            while abs(self.trail[itrail]) not in seen:
+                itrail -= 1
+
+            p = self.trail[itrail]
+            itrail -= 1
+            counter -= 1
+
+            if not counter:
+                break
+
+            seen.discard(abs(p))
+            clause = self.clauses[self.reason[abs(p)]]
+
+        learnt[0] = -p
+
+        backjump_level = 0
+
+        if 1 < len(learnt):
+            imax = max(range(1, len(learnt)), key=lambda i: self.level[abs(learnt[i])])
+            learnt[1], learnt[imax] = learnt[imax], learnt[1]
+            backjump_level = self.level[abs(learnt[1])]
+
+        self.var_inc /= self.var_decay
+
+        return learnt, backjump_level
+
+    def cancel_until(self, level):
+        if self.decision_level() <= level:
+            return
+
+        start = self.trail_lim[level]
+
+        for lit in self.trail[start:]:
+            v = abs(lit)
+            self.phase[v] = self.assigns[v]
+            self.assigns[v] = 0
+            self.reason[v] = None
+            heapq.heappush(self.order_heap, (-self.activity[v], v))
+
+        del self.trail[start:]
+        del self.trail_lim[level:]
+        self.qhead = len(self.trail)
+
+    def pick_branch_var(self):
+        while self.order_heap:
+            act, v = heapq.heappop(self.order_heap)
+            if not self.assigns[v] and -act == self.activity[v]:
+                return v
+
+        # stale entries only, fall back to a scan
+
+        for v in range(1, self.num_vars + 1):
+            if not self.assigns[v]:
+                return v
+
+        return None
+
+    # Returns True (model in self.assigns) or False (unsatisfiable)
+
+    def solve(self):
+        if not self.ok:
+            return False
+
+        if self.propagate() is not None:
+            self.ok = False
+            return False
+
+        restart_count = 0
+
+        while True:
+            conflict_limit = self.restart_base * luby(restart_count)
+            conflicts = 0
+
+            while True:
+                ci = self.propagate()
+
+                if ci is not None:
+                    self.stats['conflicts'] += 1
+                    conflicts += 1
+
+                    if 0 == self.decision_level():
+                        self.ok = False
+                        return False
+
+                    learnt, backjump_level = self.analyze(ci)
+                    self.cancel_until(backjump_level)
+
+                    if 1 == len(learnt):
+                        self.enqueue(learnt[0], None)
+                    else:
+                        self.stats['learnt'] += 1
+                        self.enqueue(learnt[0], self.attach(learnt))
+
+                elif conflicts >= conflict_limit:
+                    self.stats['restarts'] += 1
+                    restart_count += 1
+                    self.cancel_until(0)
+                    break
+
+                else:
+                    v = self.pick_branch_var()
+
+                    if v is None:
+                        return True
+
+                    self.stats['decisions'] += 1
+                    self.trail_lim.append(len(self.trail))
+                    self.enqueue(v if self.phase[v] == 1 else -v, None)
+
+    def model(self):
+        return [v for v in range(1, self.num_vars + 1) if self.assigns[v] == 1]
+
+
+# Enumerate solutions as grids, solution[row][col] = member index. Each
+# solution found is blocked (on the non pinned columns) before searching
+# for the next one.
+
+def solve_cnf(nrows, ncols, num_vars, clauses, max_solutions=None, stats=None):
+    solver = CdclSolver(num_vars)
+
+    for clause in clauses:
+        if not solver.add_clause(clause):
+            break
+
+    while max_solutions is None or 0 < max_solutions:
+        if not solver.solve():
+            break
+
+        solution = [[None] * ncols for _ in range(nrows)]
+        blocking = []
+
+        for v in solver.model():
+            row, rem = divmod(v - 1, ncols * nrows)
+            col, member = divmod(rem, nrows)
+            solution[row][col] = member
+
+            if col:
+                blocking.append(-v)
+
+        yield solution
+
+        if max_solutions is not None:
+            max_solutions -= 1
+
+        if not solver.add_clause(blocking):
+            break
+
+    if stats is not None:
+        stats.update(solver.stats)
+
+
+def solve_puzzle(puzzle, max_solutions=None, stats=None):
+    nrows, ncols = puzzle.dim
+    num_vars, clauses = encode_puzzle(nrows, ncols, puzzle.rule_data)
+    return solve_cnf(nrows, ncols, num_vars, clauses, max_solutions, stats)
+
+
+# With no puzzle files, solve the wizards puzzle encoded in
+# SolveWizardsPuzzlePure.py. Otherwise solve each puzzle file given (see
+# LogicGridPuzzle.py for the format).
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Solve logic grid puzzles with the built in SAT solver.'
+    )
+    parser.add_argument('puzzle_files', nargs='*')
+    parser.add_argument('--max-solutions', type=int, default=None)
+    parser.add_argument('--dimacs', metavar='CNF_FILE',
+        help='write the CNF in DIMACS format instead of solving (with several '
+            'puzzles, one file each, named CNF_FILE with the puzzle name '
+            'added before the extension)')
+    parser.add_argument('--stats', action='store_true',
+        help='print solver statistics')
+    args = parser.parse_args()
+
+    if args.puzzle_files:
+        puzzles = [LogicGridPuzzle.load_puzzle(p) for p in args.puzzle_files]
+        models = [
+            (p.name, p.dim, p.rule_data, p.get_member_name)
+            for p in puzzles
+        ]
+    else:
+        import SolveWizardsPuzzlePure as pure
+
+        categories = [pure.catagory_enum_lookup[c.name] for c in pure.Catagory]
+
+        models = [ (
+            'wizards',
+            (len(pure.Realm), len(categories)),
+            rule_data_from_rules(pure.rules),
+            lambda icol, imember: categories[icol](imember).name.capitalize()
+        ) ]
+
+    for name, (nrows, ncols), rule_data, get_member_name in models:
+        num_vars, clauses = encode_puzzle(nrows, ncols, rule_data)
+
+        if args.dimacs:
+            dimacs_path = args.dimacs
+
+            if 1 < len(models):
+                root, ext = os.path.splitext(args.dimacs)
+                dimacs_path = f"{root}.{os.path.splitext(name)[0]}{ext}"
+
+            with open(dimacs_path, 'w') as f:
+                write_dimacs(num_vars, clauses, f, [f"{name} {nrows}x{ncols}"])
+            continue
+
+        stats = {}
+        solnum = 0
+
+        for solution in solve_cnf(nrows, ncols, num_vars, clauses,
+                args.max_solutions, stats):
+            solnum += 1
+
+            print(f"Solution: {solnum}")
+            print()
+
+            for row in solution:
+                print(' '.join(
+                    get_member_name(icol, m).ljust(11)
+                    for icol, m in enumerate(row)
+                ))
+
+            print()
+
+        if args.stats:
+            print(f"{name}: {solnum} solutions, {stats}")